@@ -1,33 +1,316 @@
-from pymahjong.models import VLOGMahjong
+# torch and the models are imported when the first model agent is loaded, so random-only runs never pay for them
 from pymahjong import MahjongEnv
-import torch
 import numpy as np
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future
 
-class MajAgent(object):
-    def __init__(self, type='random', path=None) -> None:
-        super().__init__()
-        self.type = type
-        
-        if type != "random":
-            state_dict = torch.load(path, map_location="cpu")
+from profiling import STARTUP
+
+# inference backends of the model agents:
+#   eager:   the VLOGMahjong module as trained
+#   script:  TorchScript trace of the scoring network, cached on disk
+#   compile: torch.compile of the scoring network, built in memory at load time
+#   int8:    Linear layers dynamically quantized to int8, traced and cached on disk
+BACKENDS = ("eager", "script", "compile", "int8")
+EXAMPLE_OBS_SHAPE = (1, MahjongEnv.PLAYER_OBS_DIM, MahjongEnv.MAHJONG_TILE_TYPES)
+
+
+def parse_agent_spec(spec: str):
+    """
+    "ddqn" -> ("ddqn", "eager"), "ddqn:int8" -> ("ddqn", "int8")
+    """
+    type, _, backend = spec.partition(":")
+    backend = backend or "eager"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r} in {spec!r}, choose from {BACKENDS}")
+    return type, backend
+
+
+# bumped whenever the traced scoring network changes, so that older cached traces are not loaded
+SCORER_VERSION = 2
+
+
+def backend_cache_path(path: str, backend: str) -> str:
+    # chkpt/mahjong_VLOG_CQL.pth -> chkpt/mahjong_VLOG_CQL.v2.int8.pt
+    return f"{os.path.splitext(path)[0]}.v{SCORER_VERSION}.{backend}.pt"
+
+
+_models = {}  # real path -> (algorithm, eval-mode VLOGMahjong)
+_scorers = {}  # (real path, backend) -> scoring network
+_model_users = {}  # real path -> number of loaded agents using it, see `unload_model`
+_models_lock = threading.RLock()
+
+
+def _load_state_dict(path: str):
+    import torch
+
+    # memory-mapped where supported, so processes loading the same file share its pages
+    try:
+        return torch.load(path, map_location="cpu", mmap=True), True
+    except TypeError:  # torch < 2.1
+        return torch.load(path, map_location="cpu"), False
+
+
+def load_model(path: str, backend: str = "eager"):
+    """
+    The process-wide (algorithm, VLOGMahjong, scoring network) of a checkpoint. Every agent of the same checkpoint
+    shares the modules, so they are loaded once per process; loading them before the worker processes fork
+    shares the weights with all workers.
+    """
+    key = os.path.realpath(path)
+    with _models_lock:
+        if key not in _models:
+            from pymahjong.models import VLOGMahjong
+
+            t0 = time.perf_counter()
+            state_dict, mmapped = _load_state_dict(path)
             if "f_s2q.network_modules.0.weight" in state_dict:
                 alg = "ddqn"
             elif "f_s2pi0.network_modules.0.weight" in state_dict:
                 alg = "bc"
             else:
                 raise Exception("Unknown model")
-            self.agent = VLOGMahjong(algorithm=alg)
-
-            keys = list(state_dict.keys())
-            for key in keys:
-                if key not in list(self.agent.state_dict().keys()):
-                    state_dict.pop(key)
-            self.agent.load_state_dict(state_dict)
-            
+            model = VLOGMahjong(algorithm=alg)
+
+            model_keys = set(model.state_dict().keys())
+            state_dict = {k: v for k, v in state_dict.items() if k in model_keys}
+            if mmapped:
+                # keep the mapped tensors instead of copying them into freshly allocated parameters
+                model.load_state_dict(state_dict, assign=True)
+            else:
+                model.load_state_dict(state_dict)
+            model.eval()
+            for param in model.parameters():
+                param.requires_grad_(False)
+            _models[key] = (alg, model)
+            STARTUP.add(f"load_model[{os.path.basename(path)}]", time.perf_counter() - t0)
+
+        alg, model = _models[key]
+        if (key, backend) not in _scorers:
+            _scorers[(key, backend)] = _build_scorer(model, path, backend)
+        return alg, model, _scorers[(key, backend)]
+
+
+def preload_models(paths_and_backends):
+    for path, backend in paths_and_backends:
+        load_model(path, backend)
+
+
+def unload_model(path: str) -> bool:
+    """
+    Drop a checkpoint and its scorers from the registry, unless a loaded agent still uses them: another agent
+    of the same checkpoint would otherwise load a second copy. True if they were dropped.
+    """
+    key = os.path.realpath(path)
+    with _models_lock:
+        if _model_users.get(key, 0) > 0:
+            return False
+        _models.pop(key, None)
+        for scorer_key in [k for k in _scorers if k[0] == key]:
+            del _scorers[scorer_key]
+    return True
+
+
+def _build_scorer(model, path: str, backend: str):
+    import torch
+
+    # the chain of `VLOGMahjong.select`, with the mean of the latent z instead of a sample of it
+    latent = getattr(model, "f_h2muzp", None)
+    if latent is None:
+        latent = getattr(model, "f_h2zp", None)  # models without a stochastic latent
+    head = getattr(model, "f_s2q", None)
+    if head is None:
+        head = getattr(model, "f_s2pi0", None)
+    chain = [getattr(model, "encoder", None), getattr(model, "forward_fnn", None), latent, head]
+    if any(module is None for module in chain):
+        if backend != "eager":
+            raise ValueError(f"The {backend} backend needs the encoder / latent / head layout of VLOGMahjong")
+        return None
+    scorer = torch.nn.Sequential(*chain).eval()  # obs (B, 93, 34) -> Q values / policy logits (B, 47)
+    if backend == "eager":
+        return scorer
+    if backend == "compile":
+        return torch.compile(scorer)
+
+    cache_path = backend_cache_path(path, backend)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= os.path.getmtime(path):
+        return torch.jit.load(cache_path, map_location="cpu")
+    if backend == "int8":
+        scorer = torch.ao.quantization.quantize_dynamic(scorer, {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.trace(scorer, torch.zeros(EXAMPLE_OBS_SHAPE))
+    traced = torch.jit.freeze(traced)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    torch.jit.save(traced, tmp_path)
+    os.replace(tmp_path, cache_path)  # several processes may build it at once
+    return traced
+
+
+class MajAgent(object):
+    def __init__(self, type='random', path=None, seed=None, backend="eager") -> None:
+        super().__init__()
+        self.type = type
+        self.path = path
+        self.backend = backend
+        self.seed(seed)
+        self.scorer = None  # the network behind `_batched_scores`
+        self.agent = None  # the model is loaded on the first decision, see `load`
+
+    def load(self):
+        if self.type != "random" and self.agent is None:
+            self.alg, self.agent, self.scorer = load_model(self.path, self.backend)
+            key = os.path.realpath(self.path)
+            with _models_lock:
+                _model_users[key] = _model_users.get(key, 0) + 1
+
+    def unload(self):
+        # the model is loaded again on the next decision
+        if self.agent is not None:
+            key = os.path.realpath(self.path)
+            with _models_lock:
+                _model_users[key] -= 1
+        self.agent = None
+        self.scorer = None
+
+    def seed(self, seed=None):
+        """
+        int, np.random.SeedSequence or None for fresh entropy. The random agent draws its actions from `rng`; a model
+        agent plays the mean of its latent z, so its decisions do not depend on any RNG at all, except for models
+        without the VLOGMahjong layout, whose own `select` samples z with a torch seed drawn from `rng`.
+        """
+        self.rng = np.random.default_rng(seed)
+
     def select_action(self,obs,valid_actions):
         if self.type == 'random':
             if MahjongEnv.PASS_RESPONSE in valid_actions:
                 valid_actions = valid_actions[:-1]
-            return np.random.choice(valid_actions)
-        else:
-            return self.agent.select(obs,valid_actions,greedy=True)
\ No newline at end of file
+            return self.rng.choice(valid_actions)
+        # a batch of one, so that every backend and the batched callers play the same (mean latent) policy
+        return int(self.select_actions(np.asarray(obs)[None], np.asarray(valid_actions)[None])[0])
+
+    def _sampled_select(self, obs: np.ndarray, mask: np.ndarray) -> int:
+        # `VLOGMahjong.select` samples z from torch's global RNG, which is seeded from `rng` just for this decision
+        import torch
+
+        with torch.random.fork_rng(devices=[]):
+            torch.manual_seed(int(self.rng.integers(2**63)))
+            return self.agent.select(obs, mask, greedy=True)
+
+    def _batched_scores(self, obs_batch: np.ndarray):
+        # one forward pass of the scoring network (mean latent), None if the model has no such layout
+        import torch
+
+        if self.scorer is None:
+            return None
+        device = getattr(self.agent, "device", torch.device("cpu")) if self.backend == "eager" else "cpu"
+        with torch.no_grad():
+            x = torch.from_numpy(obs_batch).to(device=device, dtype=torch.float32)
+            return self.scorer(x).cpu().numpy()
+
+    def select_actions(self, obs_batch: np.ndarray, mask_batch: np.ndarray) -> np.ndarray:
+        """
+        Greedy actions for a batch of (B, 93, 34) observations and (B, 47) n-hot valid action masks. The latent z
+        of the model is its mean rather than a sample, for `select_action` as well.
+        """
+        mask_batch = np.asarray(mask_batch, dtype=bool)
+        if self.type == 'random':
+            # same as `select_action`: never choose PASS_RESPONSE when other choices exist
+            mask = mask_batch.copy()
+            mask[:, MahjongEnv.PASS_RESPONSE] &= mask.sum(axis=1) == 1
+            noise = self.rng.random(mask.shape)
+            return np.argmax(np.where(mask, noise, -1.0), axis=1)
+
+        self.load()
+        scores = self._batched_scores(obs_batch)
+        if scores is None:
+            return np.array(
+                [self._sampled_select(obs, mask) for obs, mask in zip(obs_batch, mask_batch)], dtype=np.int64
+            )
+        scores = np.where(mask_batch, scores, -np.inf)
+        return np.argmax(scores, axis=1)
+
+
+class InferenceDispatcher(object):
+    """
+    Micro-batching front of one `MajAgent`: decisions submitted from any table or seat are collected for
+    at most `max_wait` seconds (or until `max_batch` are pending) and answered by one `select_actions` call.
+    `select_action` has the same signature as `MajAgent.select_action` so it can stand in for the agent.
+    """
+
+    def __init__(self, agent: MajAgent, max_batch: int = 64, max_wait: float = 0.002) -> None:
+        super().__init__()
+        self.agent = agent
+        self.type = agent.type
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+
+    def submit(self, obs: np.ndarray, valid_actions: np.ndarray) -> Future:
+        future = Future()
+        self._queue.put((obs, valid_actions, future))
+        return future
+
+    def seed(self, seed=None):
+        self.agent.seed(seed)
+
+    def select_action(self, obs, valid_actions):
+        if self.type == 'random':
+            return self.agent.select_action(obs, valid_actions)
+        return self.submit(obs, valid_actions).result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _collect(self, first):
+        pending = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(pending) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:  # closing, serve what we have first
+                self._queue.put(None)
+                break
+            pending.append(item)
+        return pending
+
+    def _serve(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            pending = self._collect(first)
+            try:
+                actions = self.agent.select_actions(
+                    np.stack([item[0] for item in pending]),
+                    np.stack([item[1] for item in pending]),
+                )
+            except Exception as e:
+                for item in pending:
+                    item[2].set_exception(e)
+                continue
+            for item, action in zip(pending, actions):
+                item[2].set_result(int(action))
+
+
+_dispatchers = {}
+_dispatchers_lock = threading.Lock()
+
+
+def get_dispatcher(type='random', path=None, max_batch=64, max_wait=0.002, backend="eager") -> InferenceDispatcher:
+    """
+    The process-wide dispatcher of a checkpoint, so all tables and seats using it share the forward passes.
+    """
+    with _dispatchers_lock:
+        key = (type, path, backend)
+        if key not in _dispatchers:
+            _dispatchers[key] = InferenceDispatcher(MajAgent(type, path, backend=backend), max_batch, max_wait)
+        return _dispatchers[key]
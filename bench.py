@@ -0,0 +1,292 @@
+"""
+Benchmarks of the engine, the wrapper, the text rendering and the agents.
+
+Every run uses fixed seeds, so two builds can be compared on the same machine:
+    python bench.py -o new.json --compare old.json
+
+`--check_backends` also reports how often each inference backend of the model agents picks the same action as
+the eager model, on observations of random play or on recorded trajectory shards (`--obs_dir`).
+"""
+import os
+import sys
+import json
+import time
+import platform
+from typing import Callable, Dict, List
+
+import numpy as np
+import yaml
+from pymahjong import MahjongEnv
+
+from agent import BACKENDS, MajAgent
+from gamecore import AGENT_CHECKPOINTS, MahjongGameCore
+from ui_utils import print_callings, print_dora_list, print_hand, print_river
+
+
+class LatencyStats(object):
+    def __init__(self) -> None:
+        super().__init__()
+        self.samples: List[int] = []  # ns
+
+    def time(self, func: Callable, *args, **kwargs):
+        t0 = time.perf_counter_ns()
+        ret = func(*args, **kwargs)
+        self.samples.append(time.perf_counter_ns() - t0)
+        return ret
+
+    def summary(self) -> Dict[str, float]:
+        if len(self.samples) == 0:
+            return {"n": 0}
+        us = np.array(self.samples, dtype=np.float64) / 1e3
+        return {
+            "n": len(us),
+            "per_sec": round(len(us) / (us.sum() / 1e6), 1),
+            "mean_us": round(float(us.mean()), 2),
+            "p50_us": round(float(np.percentile(us, 50)), 2),
+            "p90_us": round(float(np.percentile(us, 90)), 2),
+            "p99_us": round(float(np.percentile(us, 99)), 2),
+        }
+
+
+def bench_env(n_steps: int, seed: int) -> Dict[str, dict]:
+    stats = {name: LatencyStats() for name in ("step", "get_obs", "get_valid_actions")}
+    rng = np.random.default_rng(seed)
+    env = MahjongEnv()
+    env.reset(oya=0, game_wind="east", seed=seed)
+    for _ in range(n_steps):
+        if env.is_over():
+            env.reset(seed=int(rng.integers(2**31 - 1)))
+            continue
+        pid = env.get_curr_player_id()
+        stats["get_obs"].time(env.get_obs, pid)
+        valid_actions = stats["get_valid_actions"].time(env.get_valid_actions)
+        stats["step"].time(env.step, pid, int(rng.choice(valid_actions)))
+    return {f"MahjongEnv.{name}": st.summary() for name, st in stats.items()}
+
+
+def bench_gamecore(config: dict, n_steps: int, seed: int) -> Dict[str, dict]:
+    """
+    All seats random, so that only the game core is measured.
+    """
+    config = dict(config, player="random", opponents=["random"] * 3, verbose=False)
+    stats = {
+        name: LatencyStats()
+        for name in (
+            "step",
+            "_update_player_infos",
+            "get_player_info_str",
+            "get_dora_info_str",
+            "print_hand",
+            "print_river",
+            "print_callings",
+            "print_dora_list",
+        )
+    }
+    gc = MahjongGameCore(config, seed=seed)
+    for _ in range(n_steps):
+        if gc.is_terminated():
+            gc.restart()
+        stats["step"].time(gc.step)
+        if gc.is_terminated():
+            continue
+
+        # the same work as one `MainWindow.render` after a step
+        if len(gc._request_table) == 0:  # re-running it would settle pending calls
+            gc._invalidate_player_states()
+            stats["_update_player_infos"].time(gc._update_player_infos)
+        stats["get_dora_info_str"].time(gc.get_dora_info_str)
+        for i in range(4):
+            stats["get_player_info_str"].time(gc.get_player_info_str, i)
+
+            state = gc.get_player_state(i)
+            stats["print_hand"].time(print_hand, state.hand, i != 0)
+            stats["print_river"].time(
+                print_river, [t.raw for t in state.river], gc.current_turn
+            )
+            stats["print_callings"].time(print_callings, gc.player_calling_info[i])
+        stats["print_dora_list"].time(
+            print_dora_list, gc.env.t.dora_indicator, gc.env.t.n_active_dora
+        )
+    return {
+        (f"MahjongGameCore.{name}" if not name.startswith("print") else name): st.summary()
+        for name, st in stats.items()
+    }
+
+
+def collect_decisions(n_decisions: int, seed: int) -> list:
+    """
+    (obs, n-hot mask, valid action indices) of `n_decisions` decision points of random play.
+    """
+    rng = np.random.default_rng(seed)
+    env = MahjongEnv()
+    env.reset(oya=0, game_wind="east", seed=seed)
+    decisions = []
+    while len(decisions) < n_decisions:
+        if env.is_over():
+            env.reset(seed=int(rng.integers(2**31 - 1)))
+            continue
+        pid = env.get_curr_player_id()
+        valid_actions = env.get_valid_actions()
+        decisions.append(
+            (env.get_obs(pid), env.get_valid_actions(nhot=True), valid_actions)
+        )
+        env.step(pid, int(rng.choice(valid_actions)))
+    return decisions
+
+
+def load_decisions(directory: str, n_decisions: int) -> list:
+    """
+    The same triples from the trajectory shards in `directory`.
+    """
+    from trajectory import list_shards, load_shard
+
+    decisions = []
+    for path in list_shards(directory):
+        data = load_shard(path)
+        for obs, mask in zip(data["obs"], data["valid_action_mask"]):
+            decisions.append((obs, mask, np.flatnonzero(mask)))
+            if len(decisions) == n_decisions:
+                return decisions
+    return decisions
+
+
+def _model_types():
+    for type in ("bc", "ddqn"):
+        path = AGENT_CHECKPOINTS[type]
+        if not os.path.exists(path):
+            print(f"{path} not found, skipping the {type} agent", file=sys.stderr)
+            continue
+        yield type, path
+
+
+def bench_agents(decisions: list, seed: int) -> Dict[str, dict]:
+    # observations are collected first, so that only `select_action` is timed
+    ret = {}
+    agents = [("random", MajAgent("random", seed=seed))]
+    for type, path in _model_types():
+        for backend in BACKENDS:
+            agents.append((f"{type}:{backend}", MajAgent(type, path, seed=seed, backend=backend)))
+    for name, agent in agents:
+        st = LatencyStats()
+        if agent.type != "random" and len(decisions) > 0:
+            # loading, tracing and compiling happen on the first decision, keep them out of the latencies
+            agent.select_action(decisions[0][0], decisions[0][1])
+        for obs, mask, valid_actions in decisions:
+            st.time(agent.select_action, obs, valid_actions if agent.type == "random" else mask)
+        ret[f"MajAgent.select_action[{name}]"] = st.summary()
+    return ret
+
+
+def check_backends(decisions: list) -> Dict[str, dict]:
+    """
+    Share of the decisions where each backend, batched, picks the action the eager agent picks one decision at a
+    time with `select_action`, as the game core asks it. The eager backend has to agree on every decision. Also
+    the largest deviation of the scores (Q values or policy logits) of each backend from the eager ones, on the
+    valid actions.
+    """
+    obs_batch = np.stack([d[0] for d in decisions])
+    mask_batch = np.stack([d[1] for d in decisions])
+    ret = {}
+    for type, path in _model_types():
+        eager = MajAgent(type, path)
+        reference = np.array([eager.select_action(obs, mask) for obs, mask, _ in decisions])
+        eager_scores = eager._batched_scores(obs_batch)
+        for backend in BACKENDS:
+            agent = MajAgent(type, path, backend=backend)
+            actions = agent.select_actions(obs_batch, mask_batch)
+            scores = agent._batched_scores(obs_batch)
+            ret[f"{type}:{backend}"] = {
+                "n": len(decisions),
+                "agreement": round(float(np.mean(actions == reference)), 4),
+                "max_score_diff": round(float(np.abs(scores - eager_scores)[mask_batch].max()), 5),
+            }
+    return ret
+
+
+def run_benchmarks(config: dict, n_steps: int, n_decisions: int, seed: int) -> dict:
+    results = {}
+    results.update(bench_env(n_steps, seed))
+    results.update(bench_gamecore(config, n_steps, seed))
+    results.update(bench_agents(collect_decisions(n_decisions, seed), seed))
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "seed": seed,
+            "n_steps": n_steps,
+            "n_decisions": n_decisions,
+        },
+        "results": results,
+    }
+
+
+def compare(new: dict, old: dict) -> str:
+    lines = [f"{'benchmark':<45}{'old p50':>12}{'new p50':>12}{'speedup':>10}"]
+    for name, st in new["results"].items():
+        old_st = old["results"].get(name)
+        if old_st is None or old_st["n"] == 0 or st["n"] == 0:
+            continue
+        lines.append(
+            f"{name:<45}{old_st['p50_us']:>12.2f}{st['p50_us']:>12.2f}{old_st['p50_us'] / st['p50_us']:>9.2f}x"
+        )
+    return "\n".join(lines)
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument("--steps", type=int, default=5000, help="steps per benchmark")
+    parser.add_argument(
+        "--decisions", type=int, default=500, help="decisions per agent"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", "-o", type=str, default="bench.json", help="result json"
+    )
+    parser.add_argument(
+        "--compare", type=str, default=None, help="result json of another build"
+    )
+    parser.add_argument(
+        "--check_backends",
+        action="store_true",
+        help="only report the agreement of the inference backends with the eager model",
+    )
+    parser.add_argument(
+        "--obs_dir", type=str, default=None, help="trajectory shards to check the backends on"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    if args.check_backends:
+        if args.obs_dir is not None:
+            decisions = load_decisions(args.obs_dir, args.decisions)
+        else:
+            decisions = collect_decisions(args.decisions, args.seed)
+        for name, st in check_backends(decisions).items():
+            print(f"{name:<45}{json.dumps(st)}")
+        sys.exit(0)
+
+    report = run_benchmarks(config, args.steps, args.decisions, args.seed)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    for name, st in report["results"].items():
+        print(f"{name:<45}{json.dumps(st)}")
+
+    if args.compare is not None:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print(compare(report, json.load(f)))
@@ -1,3 +1,4 @@
+import copy
 import gym
 import numpy as np
 import warnings
@@ -6,6 +7,103 @@ import MahjongPyWrapper as pm
 
 np.set_printoptions(threshold=np.inf)
 
+# builds of pymahjong whose Table can be deep-copied restore snapshots natively, the others replay the actions
+NATIVE_TABLE_COPY = hasattr(pm.Table, "__deepcopy__")
+# and builds without a table seed deal unreproducible walls, so their rounds can be neither recorded nor replayed
+SEEDED_TABLES = hasattr(pm.Table, "seed")
+
+N_TILES = 136
+GAME_WINDS = ("east", "south", "west", "north")
+
+
+class EnvSnapshot(object):
+    """
+    Immutable state of a `MahjongEnv`: the round setup and every step since, plus a copy of the table when
+    the build supports it. Restoring one does not consume it, so it can be restored any number of times.
+    """
+
+    __slots__ = (
+        "round",
+        "actions",
+        "game_count",
+        "rng_state",
+        "table",
+        "riichi_stage2",
+        "may_riichi_tile_id",
+        "fingerprint",
+    )
+
+    def __init__(
+        self, round, actions, game_count, rng_state, table, riichi_stage2, may_riichi_tile_id, fingerprint
+    ) -> None:
+        self.round = round  # (seed, oya, game_wind, debug_mode, yama)
+        self.actions = actions  # ((player_id, action, kan_tile_id), ...)
+        self.game_count = game_count
+        self.rng_state = rng_state
+        self.table = table
+        self.riichi_stage2 = riichi_stage2
+        self.may_riichi_tile_id = may_riichi_tile_id
+        self.fingerprint = fingerprint  # to check that a replay reached the same table
+
+
+class ReplayDivergedError(RuntimeError):
+    pass
+
+
+class InformationSet(object):
+    """
+    What one player knows at its decision: the round and the steps taken since, the wall the round was dealt from
+    (tile ids), the tiles the player has seen and its observation. See `MahjongEnv.redeal`.
+    """
+
+    __slots__ = (
+        "player_id",
+        "round",
+        "actions",
+        "yama",
+        "seen",
+        "in_wall",
+        "obs",
+        "valid_actions",
+        "game_count",
+        "rng_state",
+    )
+
+    def __init__(
+        self, player_id, round, actions, yama, seen, in_wall, obs, valid_actions, game_count, rng_state
+    ) -> None:
+        self.player_id = player_id
+        self.round = round
+        self.actions = actions
+        self.yama = yama
+        self.seen = seen  # hand of the player, every river and call, the dora indicators turned so far
+        self.in_wall = in_wall  # tiles not drawn yet
+        self.obs = obs
+        self.valid_actions = valid_actions
+        self.game_count = game_count
+        self.rng_state = rng_state
+
+
+_deal_positions = {}  # oya -> wall positions of the initial hand of each player
+
+
+def _get_deal_positions(oya: int):
+    if oya not in _deal_positions:
+        # the wall 0, 1, ..., 135 deals every player the positions of its tiles, in the order of its hand
+        t = pm.Table()
+        t.game_init_with_config(list(range(N_TILES)), [MahjongEnv.INIT_POINTS] * 4, 0, 0, 0, oya)
+        _deal_positions[oya] = [[tile.id for tile in t.players[i].hand] for i in range(4)]
+    return _deal_positions[oya]
+
+
+def _shuffle_tiles(yama, tiles, rng: np.random.Generator):
+    # the wall with the tiles in `tiles` shuffled among their positions
+    yama = list(yama)
+    positions = [i for i, tile in enumerate(yama) if tile in tiles]
+    for i, tile in zip(positions, rng.permutation([yama[i] for i in positions])):
+        yama[i] = int(tile)
+    return tuple(yama)
+
 
 class MahjongEnv(gym.Env):
     PLAYER_OBS_DIM = 93
@@ -52,6 +150,7 @@ class MahjongEnv(gym.Env):
         "GAME_OVER",
         "P1_DRAW, P2_DRAW, P3_DRAW, P4_DRAW",
     )
+    GAME_OVER_PHASE = 16
 
     # pymahjhong.BaseAction
     ACTION_TYPES = (
@@ -71,6 +170,10 @@ class MahjongEnv(gym.Env):
     def __init__(self):
         self.t = pm.Table()
         self.game_count = 0
+        self.recorder = None  # record.GameRecorder, logs seeds and actions when attached
+        self.rng = np.random.default_rng()  # reseeded by reset(seed=...)
+        self._round = None  # setup of the current round and the steps taken since, see `snapshot`
+        self._actions = []
 
         self.observation_space = Box(
             dtype=bool,
@@ -98,43 +201,81 @@ class MahjongEnv(gym.Env):
             dtype=np.int8,
         )
         self.act_container = np.zeros([self.ACTION_DIM], dtype=np.int8)
+        self.valid_actions_container = np.zeros([self.ACTION_DIM], dtype=bool)
+
+        # Values read from the table, cached until the table state changes. The version is bumped by every
+        # selection (and by entering riichi step 2), which is the only way the state of the table changes;
+        # code making a selection on `self.t` directly has to call `_invalidate()`.
+        self.state_version = 0
+        self._invalidate()
+
+        # read-only views, valid until the next call filling the containers (usually the next step)
+        self._full_obs_view = self.obs_container.view(bool)
+        self._full_obs_view.flags.writeable = False
+        self._obs_view = self._full_obs_view[: self.PLAYER_OBS_DIM]
+        self._oracle_obs_view = self._full_obs_view[-self.ORACLE_OBS_DIM :]
+        self._valid_actions_view = self.valid_actions_container.view()
+        self._valid_actions_view.flags.writeable = False
+
+    def _invalidate(self):
+        self.state_version += 1
+        self._phase = None
+        self._selecting_player = None
+        self._num_aval_actions = None
+        self._riichi_tiles = None
+        self._act_encoded = False  # act_container holds the encoding of the current table state
+        self._valid_filled = False  # valid_actions_container holds the valid actions of the current state
+
+    def _get_phase(self):
+        if self._phase is None:
+            self._phase = self.t.get_phase()
+        return self._phase
+
+    def _who_make_selection(self):
+        if self._selecting_player is None:
+            self._selecting_player = self.t.who_make_selection()
+        return self._selecting_player
+
+    def _get_riichi_tiles(self):
+        if self._riichi_tiles is None:
+            self._riichi_tiles = frozenset(
+                int(riichi_tile) for riichi_tile in pm.encv1_get_riichi_tiles(self.t)
+            )
+        return self._riichi_tiles
 
     def _check_player(self, player_id):
-        if not player_id == self.t.who_make_selection():
+        if not player_id == self._who_make_selection():
             raise ValueError(
                 "You are trying to obtain information from a player who is not making decision !!!! \
                 (current acting player ID is {}, you are trying to get information of player {}".format(
-                    self.t.who_make_selection(), player_id
+                    self._who_make_selection(), player_id
                 )
             )
 
     def _proceed(self):
         while not self.is_over():  # continue until game over or one player has choices
-            phase = self.t.get_phase()
-            if phase < 4:
-                aval_actions = self.t.get_self_actions()
-            elif phase < 16:
-                aval_actions = self.t.get_response_actions()
-            else:
-                aval_actions = [-1]
-            if len(aval_actions) > 1:
+            if self._get_num_aval_actions() > 1:
                 break
             else:
                 self.t.make_selection(0)
+                self._invalidate()
 
     def _get_num_aval_actions(self):
-        phase = self.t.get_phase()
+        if self._num_aval_actions is None:
+            phase = self._get_phase()
 
-        if phase < 4:
-            aval_actions = self.t.get_self_actions()
-        elif phase < 16:
-            aval_actions = self.t.get_response_actions()
-        else:
-            aval_actions = [-1]
+            if phase < 4:
+                aval_actions = self.t.get_self_actions()
+            elif phase < 16:
+                aval_actions = self.t.get_response_actions()
+            else:
+                aval_actions = [-1]
 
-        return len(aval_actions)
+            self._num_aval_actions = len(aval_actions)
+        return self._num_aval_actions
 
-    def reset(self, oya=None, game_wind=None, seed=None, debug_mode=None):
+    def reset(self, oya=None, game_wind=None, seed=None, debug_mode=None, yama=None):
+        # `yama`: the 136 tile ids to deal the round from instead of the wall of the seed, see `redeal`
         if oya is None:
             oya = self.game_count % 4  # Each player alternatively be the "Oya" (parent)
         else:
@@ -145,18 +286,39 @@ class MahjongEnv(gym.Env):
         else:
             assert game_wind in ["east", "south", "west", "north"]
 
+        if seed is None and SEEDED_TABLES:
+            seed = int(self.rng.integers(0, 2**31 - 1))  # replays and snapshots need the seed
+        if not SEEDED_TABLES and seed is not None:
+            raise RuntimeError("this pymahjong build cannot seed its tables, reset without a seed")
+        if not SEEDED_TABLES and self.recorder is not None:
+            raise RuntimeError("this pymahjong build cannot seed its tables, so its rounds cannot be recorded")
+
         self.t = pm.Table()
         if seed is not None:
             self.t.seed = seed
+            self.rng = np.random.default_rng(seed)
+        self._round = (seed, oya, game_wind, debug_mode, yama)
+        self._actions = []
 
         if debug_mode is not None:
             self.t.set_debug_mode(debug_mode)
 
-        self.t.game_init_with_metadata({"oya": str(oya), "wind": game_wind})
+        if yama is None:
+            self.t.game_init_with_metadata({"oya": str(oya), "wind": game_wind})
+        else:
+            if self.recorder is not None:
+                raise ValueError("a round dealt from a given wall cannot be recorded by its seed")
+            # points and sticks as game_init_with_metadata leaves them
+            self.t.game_init_with_config(
+                list(yama), [self.INIT_POINTS] * 4, 0, 0, GAME_WINDS.index(game_wind), oya
+            )
+        self._invalidate()
         self.riichi_stage2 = False
         self.may_riichi_tile_id = None
 
         self.game_count += 1
+        if self.recorder is not None:
+            self.recorder.begin_round(seed, oya, game_wind)
 
         self._proceed()
 
@@ -175,12 +337,10 @@ class MahjongEnv(gym.Env):
                 )
             )
 
+        kan_tile_id = None
         if not self.riichi_stage2:
-            self.act_container.fill(0)
             curr_pid = self.get_curr_player_id()
-            pm.encv1_encode_action(
-                self.t, curr_pid, self.act_container
-            )  # no need zeros
+            self._encode_action()
 
             if self.act_container[action] == 0:
                 raise ValueError(
@@ -190,13 +350,10 @@ class MahjongEnv(gym.Env):
             # ------- IF riichi is possible -------------
             # riichi is divided to 2 steps: first choosing a tile to discard, then decide if to riichi (if possible)
             if self.act_container[self.RIICHI]:
-                riichi_tiles = pm.encv1_get_riichi_tiles(self.t)
-                riichi_tiles_id = set()
-                for riichi_tile in riichi_tiles:
-                    riichi_tiles_id.add(int(riichi_tile))
-                if action in riichi_tiles_id:
+                if action in self._get_riichi_tiles():
                     self.riichi_stage2 = True
                     self.may_riichi_tile_id = action
+                    self._invalidate()  # same table, but the observation and valid actions change
 
             # not involving riichi
             if not self.riichi_stage2:
@@ -227,20 +384,20 @@ class MahjongEnv(gym.Env):
                 # However, this case should be very rare in normal play
 
                 elif action == self.ANKAN:
-                    if specified_tile:
+                    if specified_tile is not None:
                         kan_tile_id = specified_tile
                     else:
-                        kan_tile_id = np.random.choice(
+                        kan_tile_id = self.rng.choice(
                             np.argwhere(self.get_obs(curr_pid)[3]).flatten()
                         )
                     corresponding_tiles = [kan_tile_id] * 4
 
                 elif action == self.KAKAN:
                     obs = self.get_obs(curr_pid)
-                    if specified_tile:
+                    if specified_tile is not None:
                         kan_tile_id = specified_tile
                     else:
-                        kan_tile_id = np.random.choice(
+                        kan_tile_id = self.rng.choice(
                             np.argwhere(
                                 (np.sum(obs[:4], axis=0) == 1)
                                 * (np.sum(obs[6:10], axis=0) == 3)
@@ -306,56 +463,285 @@ class MahjongEnv(gym.Env):
             self.riichi_stage2 = False
             self.may_riichi_tile_id = None
 
+        if not self.riichi_stage2:
+            self._invalidate()
+        if action not in (self.ANKAN, self.KAKAN):
+            kan_tile_id = None
+        self._actions.append((player_id, action, kan_tile_id))
+        if self.recorder is not None:
+            self.recorder.record(player_id, action, kan_tile_id)
         self._proceed()
 
-    def _get_obs_from_table(self, player_id):
-        self.obs_container.fill(0)  # passing zeros array to C++
-        pm.encv1_encode_table(self.t, player_id, True, self.obs_container)
+    def snapshot(self) -> EnvSnapshot:
+        return EnvSnapshot(
+            self._round,
+            tuple(self._actions),
+            self.game_count,
+            self.rng.bit_generator.state,
+            copy.deepcopy(self.t) if NATIVE_TABLE_COPY else None,
+            self.riichi_stage2,
+            self.may_riichi_tile_id,
+            self._fingerprint(),
+        )
+
+    def _fingerprint(self) -> str:
+        # hands, rivers, calls and points of every player
+        return "\n".join(self.t.players[i].to_string() for i in range(4))
+
+    def restore(self, snapshot: EnvSnapshot):
+        """
+        Bring the env back to `snapshot`. Without a native table copy the steps are replayed, starting from
+        the current state when it is on the way to the snapshot (e.g. restoring a snapshot of a later step
+        of the same round), from the start of the round otherwise. Nothing is sent to the recorder.
+        A replay relies on the seed dealing the same wall; `ReplayDivergedError` is raised if it reaches
+        another table than the one of the snapshot.
+        """
+        if snapshot.table is not None:
+            self.t = copy.deepcopy(snapshot.table)
+            self._round = snapshot.round
+            self._actions = list(snapshot.actions)
+            self.riichi_stage2 = snapshot.riichi_stage2
+            self.may_riichi_tile_id = snapshot.may_riichi_tile_id
+            self._invalidate()
+        else:
+            n = len(self._actions)
+            on_the_way = (
+                self._round == snapshot.round
+                and n <= len(snapshot.actions)
+                and snapshot.actions[:n] == tuple(self._actions)
+            )
+            if not on_the_way and snapshot.round[0] is None:
+                raise ReplayDivergedError("this pymahjong build cannot seed its tables, the round cannot be replayed")
+            recorder, self.recorder = self.recorder, None
+            try:
+                if not on_the_way:
+                    seed, oya, game_wind, debug_mode, yama = snapshot.round
+                    self.reset(oya=oya, game_wind=game_wind, seed=seed, debug_mode=debug_mode, yama=yama)
+                    n = 0
+                self._replay(snapshot.actions[n:])
+                diverged = self._fingerprint() != snapshot.fingerprint
+            except ValueError:  # a step of the snapshot is not valid on the replayed table
+                diverged = True
+            finally:
+                self.recorder = recorder
+            if diverged:
+                raise ReplayDivergedError(
+                    f"replaying {len(snapshot.actions)} steps of round {snapshot.round} did not reach the table "
+                    "of the snapshot, the seed does not determine the wall of this pymahjong build"
+                )
+        self.game_count = snapshot.game_count
+        self.rng.bit_generator.state = snapshot.rng_state
+
+    def _replay(self, actions, redealt_hands=False):
+        for player_id, action, kan_tile_id in actions:
+            if redealt_hands:
+                # a redealt hand may be offered calls the dealt one was not, the player passes on them
+                while (
+                    not self.is_over()
+                    and (self.get_curr_player_id() != player_id or not self.valid_actions_view()[action])
+                    and self.valid_actions_view()[self.PASS_RESPONSE]
+                ):
+                    self.step(self.get_curr_player_id(), self.PASS_RESPONSE)
+                # and may not be offered calls the dealt one passed on
+                if action == self.PASS_RESPONSE and (
+                    self.is_over()
+                    or self.get_curr_player_id() != player_id
+                    or not self.valid_actions_view()[action]
+                ):
+                    continue
+            self.step(player_id, action, specified_tile=kan_tile_id)
+
+    def _round_yama(self):
+        # the wall the current round was dealt from, in the order of `reset(yama=...)`
+        seed, oya, game_wind, debug_mode, yama = self._round
+        if yama is not None:
+            return yama
+        if seed is None:
+            raise ReplayDivergedError("this pymahjong build cannot seed its tables, the wall of the round is unknown")
+        t = pm.Table()
+        t.seed = seed
+        t.game_init_with_metadata({"oya": str(oya), "wind": game_wind})
+        yama = [tile.id for tile in t.yama] + [None] * (N_TILES - len(t.yama))
+        for i, positions in enumerate(_get_deal_positions(oya)):
+            for position, tile in zip(positions, t.players[i].hand):
+                yama[position] = tile.id
+        return tuple(yama)
+
+    def information_set(self, player_id: int) -> InformationSet:
+        """
+        What `player_id` knows at its current decision, to `redeal` the tiles it has not seen.
+        """
+        self._check_player(player_id)
+        seen = {tile.id for tile in self.t.players[player_id].hand}
+        for i in range(4):
+            player = self.t.players[i]
+            seen.update(river_tile.tile.id for river_tile in player.get_river().river)
+            for fuuro in player.get_fuuros():
+                seen.update(tile.id for tile in fuuro.tiles)
+        seen.update(tile.id for tile in self.t.dora_indicator[: self.t.n_active_dora])
+        return InformationSet(
+            player_id,
+            self._round,
+            tuple(self._actions),
+            self._round_yama(),
+            frozenset(seen),
+            frozenset(tile.id for tile in self.t.yama),
+            self.get_obs(player_id),
+            self.get_valid_actions(nhot=True),
+            self.game_count,
+            self.rng.bit_generator.state,
+        )
+
+    def redeal(self, info: InformationSet, rng: np.random.Generator, max_tries: int = 16) -> bool:
+        """
+        Deal the tiles `info.player_id` has not seen anew and replay the steps of `info` on the new wall, so that
+        the decision looks the same to the player while the hands of the others and the wall are a random guess
+        consistent with it. A deal is rejected when its replay does not reach the same observation, e.g. when a
+        step of another player cannot be made with its new hand. After `max_tries` rejected deals, only the tiles
+        left in the wall are dealt anew, which always replays. Returns whether the hands were dealt anew.
+        Nothing is sent to the recorder.
+        """
+        seed, oya, game_wind, debug_mode, _ = info.round
+        unseen = frozenset(range(N_TILES)) - info.seen
+        recorder, self.recorder = self.recorder, None
+        try:
+            for n_try in range(max_tries + 1):
+                in_hands = n_try < max_tries
+                yama = _shuffle_tiles(info.yama, unseen if in_hands else unseen & info.in_wall, rng)
+                self.reset(oya=oya, game_wind=game_wind, seed=seed, debug_mode=debug_mode, yama=yama)
+                try:
+                    self._replay(info.actions, redealt_hands=in_hands)
+                except ValueError:
+                    continue
+                if (
+                    not self.is_over()
+                    and self.get_curr_player_id() == info.player_id
+                    and np.array_equal(self.get_obs(info.player_id), info.obs)
+                    and np.array_equal(self.get_valid_actions(nhot=True), info.valid_actions)
+                ):
+                    return in_hands
+        finally:
+            self.recorder = recorder
+            self.game_count = info.game_count
+            self.rng.bit_generator.state = info.rng_state
+        raise ReplayDivergedError(
+            f"no wall dealt anew replays {len(info.actions)} steps of round {info.round[:4]} to the same decision"
+        )
+
+    def _encode_table(self, player_id, container):
+        container.fill(0)  # passing zeros array to C++
+        pm.encv1_encode_table(self.t, player_id, True, container)
         if self.riichi_stage2:
             pm.encv1_encode_table_riichi_step2(
-                self.t, self.may_riichi_tile_id, self.obs_container
+                self.t, self.may_riichi_tile_id, container
             )
 
-    def get_obs(self, player_id: int):
+    def _get_obs_from_table(self, player_id):
+        self._encode_table(player_id, self.obs_container)
+
+    @staticmethod
+    def _write_out(src, out):
+        if out.dtype == bool:
+            np.not_equal(src, 0, out=out)
+        else:
+            np.copyto(out, src)
+        return out
+
+    def get_obs(self, player_id: int, out=None):
         self._check_player(player_id)
         self._get_obs_from_table(player_id)
+        if out is not None:
+            return self._write_out(self.obs_container[: self.PLAYER_OBS_DIM], out)
         return self.obs_container[: self.PLAYER_OBS_DIM].astype(bool)
 
-    def get_oracle_obs(self, player_id: int):
+    def get_oracle_obs(self, player_id: int, out=None):
         self._check_player(player_id)
         self._get_obs_from_table(player_id)
+        if out is not None:
+            return self._write_out(self.obs_container[-self.ORACLE_OBS_DIM :], out)
         return self.obs_container[-self.ORACLE_OBS_DIM :].astype(bool)
 
-    def get_full_obs(self, player_id: int):
+    def get_full_obs(self, player_id: int, out=None):
         self._check_player(player_id)
+        if out is not None:
+            if out.dtype in (bool, np.int8) and out.flags.c_contiguous:
+                # the encoder writes a whole full observation, check the buffer before handing it over
+                if out.shape != self.obs_container.shape:
+                    raise ValueError(
+                        f"out has shape {out.shape}, a full observation needs {self.obs_container.shape}"
+                    )
+                # bool and int8 share the layout, encode straight into the caller's buffer
+                self._encode_table(player_id, out.view(np.int8))
+                return out
+            self._get_obs_from_table(player_id)
+            return self._write_out(self.obs_container, out)
         self._get_obs_from_table(player_id)
-        return self.obs_container.copy().astype(bool)
+        return self.obs_container.astype(bool)
 
-    def get_valid_actions(self, nhot=False):
-        if not self.riichi_stage2:
-            self.act_container.fill(0)
+    # zero-copy accessors: the returned read-only views are overwritten by the next encoding
+    def obs_view(self, player_id: int):
+        self._check_player(player_id)
+        self._get_obs_from_table(player_id)
+        return self._obs_view
+
+    def oracle_obs_view(self, player_id: int):
+        self._check_player(player_id)
+        self._get_obs_from_table(player_id)
+        return self._oracle_obs_view
+
+    def full_obs_view(self, player_id: int):
+        self._check_player(player_id)
+        self._get_obs_from_table(player_id)
+        return self._full_obs_view
+
+    def valid_actions_view(self):
+        self._fill_valid_actions(self.valid_actions_container)
+        return self._valid_actions_view
+
+    def _encode_action(self):
+        if not self._act_encoded:
+            self.act_container.fill(0)  # no need zeros
             pm.encv1_encode_action(
                 self.t, self.get_curr_player_id(), self.act_container
             )
-            act_container = self.act_container.copy().astype(bool)
+            self._act_encoded = True
+
+    def _fill_valid_actions(self, act_container):
+        if not self._valid_filled:
+            self._compute_valid_actions()
+        if act_container is not self.valid_actions_container:
+            np.copyto(act_container, self.valid_actions_container)
+        return act_container
+
+    def _compute_valid_actions(self):
+        act_container = self.valid_actions_container
+        if not self.riichi_stage2:
+            self._encode_action()
+            np.not_equal(self.act_container, 0, out=act_container)
             act_container[self.RIICHI] = 0
             act_container[self.PASS_RIICHI] = 0
             if (
-                np.sum(
-                    act_container[self.CHILEFT : self.PON + 1]
-                    + act_container[self.MINKAN]
-                    + act_container[self.RON]
-                )
-                > 0
+                act_container[self.CHILEFT : self.PON + 1].any()
+                or act_container[self.MINKAN]
+                or act_container[self.RON]
             ):
                 act_container[self.PASS_RESPONSE] = 1
             # elif self.t.players[0].riichi and act_container[self.TSUMO] > 0:
             #     act_container[self.PASS_RESPONSE] = 1
         else:
-            act_container = np.zeros([self.ACTION_DIM], dtype=bool)
+            act_container.fill(0)
             act_container[self.RIICHI] = 1
             act_container[self.PASS_RIICHI] = 1
+        self._valid_filled = True
+
+    def get_valid_actions(self, nhot=False, out=None):
+        if out is not None:
+            # always n-hot when writing into a buffer
+            return self._fill_valid_actions(out)
 
+        act_container = self._fill_valid_actions(
+            np.zeros([self.ACTION_DIM], dtype=bool)
+        )
         if nhot:
             return act_container
         else:
@@ -368,12 +754,13 @@ class MahjongEnv(gym.Env):
         return payoffs
 
     def is_over(self):
-        return self.Phases[self.t.get_phase()] == "GAME_OVER"
+        return self._get_phase() == self.GAME_OVER_PHASE
 
     def get_curr_player_id(self):
-        if self.t.get_phase() < 16:
-            return self.t.who_make_selection()
-        elif self.t.get_phase() == 16:
+        phase = self._get_phase()
+        if phase < 16:
+            return self._who_make_selection()
+        elif phase == 16:
             warnings.warn("This game has ended, get_curr_player_id return -1 !!")
             return -1
         else:
@@ -395,6 +782,122 @@ class MahjongEnv(gym.Env):
         print(self.t.players[3].to_string())
 
 
+class VecMahjongEnv(object):
+    """
+    K independent tables stepped together, with observations and action masks written into
+    preallocated (K, 93, 34) / (K, 47) arrays so that one batched call can serve all tables.
+    Tables whose game is over are reset automatically after `step_batch`.
+    """
+
+    def __init__(self, num_envs: int):
+        self.num_envs = num_envs
+        self.envs = [MahjongEnv() for _ in range(num_envs)]
+
+        self.observation_space = self.envs[0].observation_space
+        self.action_space = self.envs[0].action_space
+
+        # C++ encoders write int8, converted to bool for the whole batch at once
+        self._obs_scratch = np.zeros(
+            [
+                num_envs,
+                MahjongEnv.PLAYER_OBS_DIM + MahjongEnv.ORACLE_OBS_DIM,
+                MahjongEnv.MAHJONG_TILE_TYPES,
+            ],
+            dtype=np.int8,
+        )
+        self._act_scratch = np.zeros([num_envs, MahjongEnv.ACTION_DIM], dtype=np.int8)
+        self.obs_batch = np.zeros(
+            [num_envs, MahjongEnv.PLAYER_OBS_DIM, MahjongEnv.MAHJONG_TILE_TYPES],
+            dtype=bool,
+        )
+        self.act_batch = np.zeros([num_envs, MahjongEnv.ACTION_DIM], dtype=bool)
+
+        self.curr_player_ids = np.full([num_envs], -1, dtype=np.int64)
+        self.payoffs = np.zeros([num_envs, 4], dtype=np.float32)
+        self.dones = np.zeros([num_envs], dtype=bool)
+
+    @property
+    def tables(self):
+        return [env.t for env in self.envs]
+
+    def _reset_env(self, k, oya=None, game_wind=None, seed=None):
+        env = self.envs[k]
+        env.reset(oya=oya, game_wind=game_wind, seed=seed)
+        while env.is_over():  # a round without any decision is skipped
+            env.reset()
+        self.curr_player_ids[k] = env.get_curr_player_id()
+
+    def reset(self, seeds=None):
+        for k in range(self.num_envs):
+            self._reset_env(k, seed=None if seeds is None else seeds[k])
+        self.payoffs.fill(0)
+        self.dones.fill(False)
+        return self.get_obs_batch()
+
+    def get_obs_batch(self):
+        """
+        Observations of the current acting player of each table (rows of finished tables are zeros).
+        The returned array is reused and overwritten by the next call.
+        """
+        for k, env in enumerate(self.envs):
+            if self.curr_player_ids[k] >= 0:
+                env._encode_table(self.curr_player_ids[k], self._obs_scratch[k])
+            else:
+                self._obs_scratch[k].fill(0)
+        np.not_equal(
+            self._obs_scratch[:, : MahjongEnv.PLAYER_OBS_DIM], 0, out=self.obs_batch
+        )
+        return self.obs_batch
+
+    def get_valid_actions_batch(self):
+        """
+        N-hot valid actions of each table, same as `MahjongEnv.get_valid_actions(nhot=True)`.
+        The returned array is reused and overwritten by the next call.
+        """
+        stage2 = np.zeros([self.num_envs], dtype=bool)
+        self._act_scratch.fill(0)
+        for k, env in enumerate(self.envs):
+            if env.riichi_stage2:
+                stage2[k] = True
+            elif self.curr_player_ids[k] >= 0:
+                env._encode_action()  # cached, so `step` does not encode it again
+                self._act_scratch[k] = env.act_container
+        act = self.act_batch
+        np.not_equal(self._act_scratch, 0, out=act)
+        act[:, MahjongEnv.RIICHI] = False
+        act[:, MahjongEnv.PASS_RIICHI] = False
+        may_response = (
+            np.any(act[:, MahjongEnv.CHILEFT : MahjongEnv.PON + 1], axis=1)
+            | act[:, MahjongEnv.MINKAN]
+            | act[:, MahjongEnv.RON]
+        )
+        act[may_response, MahjongEnv.PASS_RESPONSE] = True
+        act[stage2] = False
+        act[stage2, MahjongEnv.RIICHI] = True
+        act[stage2, MahjongEnv.PASS_RIICHI] = True
+        return act
+
+    def step_batch(self, actions):
+        """
+        Apply actions[k] for the current acting player of table k (negative actions are skipped).
+        Finished tables are reset; their payoffs are in the returned (K, 4) array and flagged in dones.
+        """
+        self.payoffs.fill(0)
+        self.dones.fill(False)
+        for k, env in enumerate(self.envs):
+            pid = self.curr_player_ids[k]
+            if pid < 0 or actions[k] < 0:
+                continue
+            env.step(int(pid), int(actions[k]))
+            if env.is_over():
+                self.payoffs[k] = env.get_payoffs()
+                self.dones[k] = True
+                self._reset_env(k)
+            else:
+                self.curr_player_ids[k] = env.get_curr_player_id()
+        return self.payoffs, self.dones
+
+
 class SingleAgentMahjongEnv(gym.Env):
     THIS_AGENT_ID = 0
     # The agent is the player 0 in MahjongEnv (while Oya may be others)
@@ -452,7 +955,7 @@ class SingleAgentMahjongEnv(gym.Env):
             if self.opponent_agent == "random":
                 aval_actions = self.env.get_valid_actions(nhot=False)
                 self.env.step(
-                    self.env.get_curr_player_id(), np.random.choice(aval_actions)
+                    self.env.get_curr_player_id(), self.env.rng.choice(aval_actions)
                 )
             else:
                 action_mask = self.env.get_valid_actions(nhot=True)
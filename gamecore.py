@@ -1,5 +1,6 @@
+import copy
 from pymahjong import MahjongEnv
-from agent import MajAgent
+from agent import MajAgent, parse_agent_spec, preload_models
 from utils import CallingInfo, CallingCategory
 from typing import Union, List, Tuple, Dict
 import numpy as np
@@ -7,8 +8,17 @@ import yaml
 from collections import defaultdict
 
 from functools import reduce
-from ui_utils import print_callings, print_river, print_hand, print_dora_list
-from utils import get_turn_from_river_tile
+from ui_utils import (
+    FragmentCache,
+    print_callings,
+    print_river,
+    print_hand,
+    print_dora_list,
+)
+from player_state import PlayerState
+from shanten import TILE_NOTATION, hand_to_counts, is_tenpai, ukeire
+from record import GameRecorder
+from profiling import PROFILER, STARTUP
 
 
 from utils import (
@@ -16,24 +26,91 @@ from utils import (
     # is_discarding,
     is_forward_call,
     notation_to_idx,
+    spawn_seeds,
     tile_exp,
 )
 
 WINDS = list(WIND_TRANSLATION_TABLE.keys())
 # print(WINDS)
 
-import time
-
 # START_POINT = 30000
 # BONUSES = np.array([15, 5, -5, -15], dtype=np.float32)
 
-np.random.seed(int(time.time()))
+MAX_TABLE_SEED = 2**31 - 1
+
+# checkpoints of the agent types in the config
+AGENT_CHECKPOINTS = {
+    "ddqn": "chkpt/mahjong_VLOG_CQL.pth",
+    "bc": "chkpt/mahjong_VLOG_BC.pth",
+}
+
+
+def agent_checkpoint(type: str) -> Union[str, None]:
+    """
+    Checkpoint of an agent entry of the config: a type above, or the path of any .pth file. None for "random".
+    """
+    if type == "random":
+        return None
+    return AGENT_CHECKPOINTS.get(type, type)
+
+
+def preload_agents(config: dict):
+    """
+    Load the weights of the config into the process-wide registry, e.g. before forking workers.
+    Traced backends are left to the workers: tracing runs a forward pass, and a parent whose OpenMP pool has
+    started cannot fork safely.
+    """
+    types = [parse_agent_spec(spec)[0] for spec in [config.get("player", "random")] + list(config["opponents"])]
+    preload_models((agent_checkpoint(type), "eager") for type in set(types) - {"random"})
+
+
+class GameCoreSnapshot(object):
+    """
+    Immutable state of a `MahjongGameCore` at a decision point, see `MahjongGameCore.snapshot`.
+    """
+
+    __slots__ = ("env", "fields", "game_status", "calling_info", "request_table", "rng_state", "agent_rng_states")
+
+    def __init__(self, env, fields, game_status, calling_info, request_table, rng_state, agent_rng_states) -> None:
+        self.env = env
+        self.fields = fields
+        self.game_status = game_status
+        self.calling_info = calling_info
+        self.request_table = request_table
+        self.rng_state = rng_state
+        self.agent_rng_states = agent_rng_states
+
+
+def _copy_game_status(game_status: Union[dict, None]) -> Union[dict, None]:
+    if game_status is None:
+        return None
+    return dict(game_status, cumulative_scores=game_status["cumulative_scores"].copy())
+
+
+def _copy_calling_info(calling_info) -> List[List[CallingInfo]]:
+    # a Ka-Kan changes the type of an existing CallingInfo, so they are copied too
+    return [[copy.copy(calling) for calling in callings] for callings in calling_info]
 
 
 class MahjongGameCore(object):
+    # plain bookkeeping restored as is by `restore` (lists and arrays are copied)
+    _SNAPSHOT_FIELDS = (
+        "extra",
+        "terminated",
+        "current_turn",
+        "last_player_idx",
+        "last_action",
+        "loser",
+        "winners",
+        "payoffs",
+        "player_states",
+        "player_infos",
+    )
+
     def __init__(
         self,
-        config: dict
+        config: dict,
+        seed: Union[int, np.random.SeedSequence, None] = None,
         # total_games=8, enable_more_games=True, agents=["ddqn", "bc", "ddqn"]
     ) -> None:
         super().__init__()
@@ -45,6 +122,11 @@ class MahjongGameCore(object):
         self.enable_honba_fee = config["enable_honba_fee"]
         self.AL_continue = config["AL_continue"]
 
+        self.verbose = config.get("verbose", True)
+        self.profiler = PROFILER
+        if config.get("profile"):
+            self.profiler.enable(trace=config["profile"] == "trace")
+
         self.START_POINT = config["REACH_PT"]
         MahjongEnv.INIT_POINTS = config["START_POINT"]
         self.BONUSES = config["BONUS_POINTS"]
@@ -53,26 +135,133 @@ class MahjongGameCore(object):
         # print(MahjongEnv.INIT_POINTS)
 
         self.env = MahjongEnv()
+        if config.get("record"):
+            self.attach_recorder(GameRecorder(config["record"]))
+        self.trajectory_sink = None
+        if config.get("trajectory_dir"):
+            from trajectory import TrajectoryWriter
+
+            self.trajectory_sink = TrajectoryWriter(
+                config["trajectory_dir"], config.get("trajectory_shard_size", 4096)
+            )
+        self._player_states: List[Union[PlayerState, None]] = [None] * 4
+        self.fragments = FragmentCache()  # rendered text pieces of the current round
         self.game_status = None
         self.terminated = False
-        self.reset()
+        self.first_oya = None  # oya of the first round, None to draw it
 
+        # agents[0] only acts for player 0 when no action is given (-f or headless runs)
         self.agents = []
-        for type in config["opponents"]:
-            path = None
-            if type == "ddqn":
-                path = "chkpt/mahjong_VLOG_CQL.pth"
-            elif type == "bc":
-                path = "chkpt/mahjong_VLOG_BC.pth"
-            self.agents.append(MajAgent(type, path))
+        for spec in [config.get("player", "random")] + list(config["opponents"]):
+            type, backend = parse_agent_spec(spec)
+            self.agents.append(MajAgent(type, agent_checkpoint(type), backend=backend))
+
+        self.seed(config.get("seed") if seed is None else seed)
+        self.reset()
+        STARTUP.mark("game_core_ready")
+
+    def seed(self, seed: Union[int, np.random.SeedSequence, None] = None):
+        """
+        Reseed the game core (oya, wall of each round) and the agents. `None` draws fresh entropy.
+        """
+        core_seed, *agent_seeds = spawn_seeds(seed, 1 + len(self.agents))
+        self.rng = np.random.default_rng(core_seed)
+        for agent, agent_seed in zip(self.agents, agent_seeds):
+            agent.seed(agent_seed)
 
     def is_terminated(self):
         return self.terminated
 
+    def attach_recorder(self, recorder: Union[GameRecorder, None]):
+        """
+        Log the seed and actions of every following round, see `record.py`.
+        """
+        self.env.recorder = recorder
+
+    def close(self):
+        """
+        Flush and close the attached recorder and trajectory sink.
+        """
+        if self.env.recorder is not None:
+            self.env.recorder.close()
+            self.env.recorder = None
+        if self.trajectory_sink is not None:
+            self.trajectory_sink.close()
+            self.trajectory_sink = None
+
+    def snapshot(self) -> GameCoreSnapshot:
+        """
+        Capture the table, the round and hanchan bookkeeping and the random states, e.g. to explore actions
+        from a decision point and `restore` it afterwards. A snapshot can be restored any number of times.
+        """
+        fields = {}
+        for name in self._SNAPSHOT_FIELDS:
+            value = getattr(self, name, None)
+            if isinstance(value, list):
+                value = tuple(value)
+            elif isinstance(value, np.ndarray):
+                value = value.copy()
+            fields[name] = value
+        return GameCoreSnapshot(
+            self.env.snapshot(),
+            fields,
+            _copy_game_status(self.game_status),
+            _copy_calling_info(self.player_calling_info),
+            dict(self._request_table),
+            self.rng.bit_generator.state,
+            [agent.rng.bit_generator.state for agent in self.agents],
+        )
+
+    def restore(self, snapshot: GameCoreSnapshot):
+        self.env.restore(snapshot.env)
+        self._restore_bookkeeping(snapshot)
+
+    def restore_redealt(self, snapshot: GameCoreSnapshot, info, rng: np.random.Generator) -> bool:
+        """
+        `restore` a snapshot taken at the decision of `info` (see `MahjongEnv.information_set`) on a table where the
+        tiles the deciding player has not seen are dealt anew (`MahjongEnv.redeal`). Of the bookkeeping, only the
+        hands differ from what every player sees; they are read from the new table.
+        Returns whether the hands of the other players were dealt anew.
+        """
+        redealt = self.env.redeal(info, rng)
+        self._restore_bookkeeping(snapshot)
+        self.player_states = [self.get_player_state(i) for i in range(4)]
+        self.player_infos = [state.info for state in self.player_states]
+        return redealt
+
+    def _restore_bookkeeping(self, snapshot: GameCoreSnapshot):
+        for name, value in snapshot.fields.items():
+            if isinstance(value, tuple):
+                value = list(value)
+            elif isinstance(value, np.ndarray):
+                value = value.copy()
+            setattr(self, name, value)
+        self.game_status = _copy_game_status(snapshot.game_status)
+        self.player_calling_info = _copy_calling_info(snapshot.calling_info)
+        self._request_table = dict(snapshot.request_table)
+        self.rng.bit_generator.state = snapshot.rng_state
+        for agent, state in zip(self.agents, snapshot.agent_rng_states):
+            agent.rng.bit_generator.state = state
+        self._invalidate_player_states()
+        self.fragments.clear()
+
+    def restart(self, seed: Union[int, np.random.SeedSequence, None] = None, oya: Union[int, None] = None):
+        """
+        Start a new hanchan from scratch, keeping the loaded agents. Reseeds everything if `seed` is given.
+        With a fixed `oya`, a seed deals the same walls in the same order whoever sits where.
+        """
+        if seed is not None:
+            self.seed(seed)
+        self.first_oya = oya
+        self.game_status = None
+        self.extra = 0
+        self.terminated = False
+        self.reset()
+
     def reset(self, change_oya=True, no_win=False):
         if self.game_status is None:
             self.game_status = {
-                "oya": np.random.randint(4),
+                "oya": int(self.rng.integers(4)) if self.first_oya is None else self.first_oya,
                 "game_wind": "east",
                 "game_count": 0,
                 "honba": 0,
@@ -129,8 +318,12 @@ class MahjongGameCore(object):
             ]
 
         self.env.reset(
-            oya=self.game_status["oya"], game_wind=self.game_status["game_wind"]
+            oya=self.game_status["oya"],
+            game_wind=self.game_status["game_wind"],
+            seed=int(self.rng.integers(MAX_TABLE_SEED)),
         )
+        self._invalidate_player_states()
+        self.fragments.clear()
         self.current_turn = 0
         self.last_player_idx = -1
         self.last_action = (
@@ -139,41 +332,59 @@ class MahjongGameCore(object):
         self.winners = []
         self.player_calling_info: List[List[CallingInfo]] = [[] for _ in range(4)]
         self.player_infos = []
+        self.player_states: List[PlayerState] = []
         self._request_table: Dict[
             int, Tuple[int, int, int]
         ] = {}  # action, turn, from_idx
 
     def check_tenpai(self, player_idx: int):
-        ten_tiles = self.env.t.players[player_idx].tenpai_to_string()
-        ten_list = [ten_tiles[i : i + 2] for i in range(0, len(ten_tiles), 2)]
-        # player_hand_str = self.get_player_info(player_idx)["Hand"]
-        # player_hand_str = player_hand_str.replace("0", "5")  # red doras
-
-        # if not self._checker.convert_strlist_to_tiles(player_hand_str):
-        #     return False
-        # ten_list = self._checker.CheckTen().split()
-        total_tile_str = self.get_player_info(player_idx)["Hand"]
-        # + " ".join(
-        #     str(calling) for calling in self.player_calling_info[player_idx]
-        # )
-        ret_list = []
-        for ten in ten_list:
-            if total_tile_str.count(ten) < 4:  # avoid virtual ten
-                ret_list.append(ten)
-        return len(ret_list) > 0
+        # a tile of which the hand holds all 4 is no wait (no virtual tenpai)
+        hand = self.get_player_state(player_idx).hand
+        if len(hand) % 3 != 1:
+            return False
+        return bool(is_tenpai(hand_to_counts(hand)))
 
-    def get_player_info(self, player_idx: int) -> defaultdict:
-        enti = self.env.t.players[player_idx]
-        player_raw_str = enti.to_string()
-        player_hand_dict = defaultdict(str)
-        player_hand_dict.update(yaml.load(player_raw_str, Loader=yaml.FullLoader))
-        if player_hand_dict["River"] is None:
-            player_hand_dict["River"] = ""
-
-        player_hand_dict["Furiten"] = (
-            enti.riichi_furiten or enti.sutehai_furiten or enti.toujun_furiten
+    def visible_tile_counts(self, player_idx: int) -> np.ndarray:
+        """
+        (34,) tiles `player_idx` can see: the own hand, every river and call, and the dora indicators.
+        """
+        tiles = list(self.get_player_state(player_idx).hand)
+        for i in range(4):
+            state = self.get_player_state(i)
+            tiles.extend(t.tile for t in state.river if not t.called)  # a called tile is shown in the call
+            for call in state.calls:
+                tiles.extend(TILE_NOTATION.findall(call))
+        tiles.extend(
+            item.to_string() for item in self.env.t.dora_indicator[: self.env.t.n_active_dora]
         )
-        return player_hand_dict
+        return hand_to_counts(tiles)
+
+    def get_discard_hints(self, player_idx: int = 0) -> Dict[int, Tuple[int, int]]:
+        """
+        {tile index: (shanten after discarding it, unseen tiles lowering that shanten)} for a hand of 3n+2 tiles.
+        """
+        hand = self.get_player_state(player_idx).hand
+        if len(hand) % 3 != 2:
+            return {}
+        counts = hand_to_counts(hand)
+        unseen = np.maximum(4 - self.visible_tile_counts(player_idx), 0)
+        after, n_effective = ukeire(counts, unseen)
+        return {int(t): (int(after[t]), int(n_effective[t])) for t in np.flatnonzero(counts)}
+
+    def _invalidate_player_states(self):
+        # must be called whenever the table is changed by `env.step` or `env.reset`
+        for i in range(4):
+            self._player_states[i] = None
+
+    def get_player_state(self, player_idx: int) -> PlayerState:
+        state = self._player_states[player_idx]
+        if state is None:
+            state = PlayerState.from_player(self.env.t.players[player_idx])
+            self._player_states[player_idx] = state
+        return state
+
+    def get_player_info(self, player_idx: int) -> defaultdict:
+        return self.get_player_state(player_idx).info
 
     def _update_player_infos(self):
         """
@@ -184,18 +395,14 @@ class MahjongGameCore(object):
         The key problem is to address automatic discarding...
 
         """
-        self.player_infos = [self.get_player_info(i) for i in range(4)]
+        self.player_states = [self.get_player_state(i) for i in range(4)]
+        self.player_infos = [state.info for state in self.player_states]
         # maintain last tile
         max_turn, max_idx = -1, -1
-        cumulative_tileinfo_river = []
-        for idx, player_hand_dict in enumerate(self.player_infos):
-            player_river: List[str] = player_hand_dict["River"].split()
-            cumulative_tileinfo_river.extend([t[2:] for t in player_river])
-            if len(player_river) > 0:
-                last_tile = player_river[-1]
-                last_turn = get_turn_from_river_tile(last_tile)
-                if last_turn > max_turn:
-                    max_turn, max_idx = last_turn, idx
+        for idx, state in enumerate(self.player_states):
+            last_turn = state.last_turn
+            if last_turn > max_turn:
+                max_turn, max_idx = last_turn, idx
         self.last_player_idx = max_idx
         self.current_turn = max_turn
 
@@ -204,11 +411,14 @@ class MahjongGameCore(object):
             requests = list(self._request_table.values())
             req_turn = requests[0][1]
             # assert all req_turn should be the same in _request_table!
-            cumulative_tileinfo_river = " ".join(cumulative_tileinfo_river) + " "
-            assert str(req_turn) in cumulative_tileinfo_river, req_turn
-            req_index = cumulative_tileinfo_river.index(str(req_turn))
-            cumulative_tileinfo_river = cumulative_tileinfo_river[req_index:]
-            if "-" in cumulative_tileinfo_river[: cumulative_tileinfo_river.index(" ")]:
+            req_tiles = [
+                river_tile
+                for state in self.player_states
+                for river_tile in state.river
+                if river_tile.turn == req_turn
+            ]
+            assert len(req_tiles) > 0, req_turn
+            if req_tiles[0].called:
                 # That means the corresponding tile has been called!
                 # compare to get who executed the operation
                 action, act_idx = 0, -1
@@ -229,10 +439,10 @@ class MahjongGameCore(object):
         a, _, from_idx = self._request_table[player_idx]
         curr_player_id = player_idx
         assert is_forward_call(a)
-        player_hand_dict = self.player_infos[curr_player_id]
+        player_state = self.player_states[curr_player_id]
         self.player_calling_info[curr_player_id].append(
             CallingInfo(
-                player_hand_dict["Calls"].split()[-1],
+                player_state.calls[-1],
                 CallingCategory.to_category(a),
                 from_idx,
             )
@@ -242,20 +452,22 @@ class MahjongGameCore(object):
     def _render_ankan_player_request(self, curr_player_id: int):
         # a == MahjongEnv.ANKAN:
         # player_hand_dict = self.get_player_info(curr_player_id)
-        player_hand_dict = self.player_infos[curr_player_id]
+        player_state = self.player_states[curr_player_id]
         self.player_calling_info[curr_player_id].append(
             CallingInfo(
-                player_hand_dict["Calls"].split()[-1],
+                player_state.calls[-1],
                 CallingCategory.Ankan,
                 curr_player_id,
             )
         )
 
-    def _render_kakan_player_request(self, curr_player_id: int, old_hand_dict: dict):
+    def _render_kakan_player_request(
+        self, curr_player_id: int, old_state: PlayerState
+    ):
         # a == MahjongEnv.KAKAN:
-        # use the stored old hand str
-        last_fuuro_raw_list = old_hand_dict["Calls"].split()
-        fuuro_raw_list = self.player_infos[curr_player_id]["Calls"].split()
+        # use the stored old state
+        last_fuuro_raw_list = old_state.calls
+        fuuro_raw_list = self.player_states[curr_player_id].calls
         for fuuro in fuuro_raw_list:
             if fuuro not in last_fuuro_raw_list:
                 break
@@ -268,21 +480,25 @@ class MahjongGameCore(object):
                 break
 
     def step(self, action=None, specified_tile: Union[int, str, None] = None):
+        with self.profiler.phase("gc.step"):
+            self._step(action, specified_tile)
+        STARTUP.mark("first_step")
+
+    def _step(self, action=None, specified_tile: Union[int, str, None] = None):
         if not self.env.is_over():
             curr_player_id = self.env.get_curr_player_id()
 
             if action is None:  # Not pre ordered
-                if curr_player_id == 0:
-                    # This part of code should only be triggered when -f is enabled to fast pass through
-                    valid_actions = self.env.get_valid_actions()
-                    if MahjongEnv.PASS_RESPONSE in valid_actions:
-                        valid_actions = valid_actions[:-1]
-                    a = np.random.choice(valid_actions)
-                else:
-                    a = self.agents[curr_player_id - 1].select_action(
-                        self.env.get_obs(curr_player_id),
-                        self.env.get_valid_actions(nhot=True),
-                    )
+                # For player 0 this should only be triggered when -f is enabled to fast pass through
+                agent = self.agents[curr_player_id]
+                with self.profiler.phase("gc.agent"):
+                    if agent.type == "random":
+                        a = agent.select_action(None, self.env.get_valid_actions())
+                    else:
+                        a = agent.select_action(
+                            self.env.get_obs(curr_player_id),
+                            self.env.get_valid_actions(nhot=True),
+                        )
             else:
                 a = action
 
@@ -296,19 +512,26 @@ class MahjongGameCore(object):
 
             if a == MahjongEnv.KAKAN:
                 # At present there's literally no means to decide which one to ka-kan, so save in advance...
-                # player_hand_dict_o = self.get_player_info(curr_player_id)
-                player_hand_dict_o = self.player_infos[curr_player_id].copy()
+                # (states are immutable and replaced after every step)
+                player_state_o = self.get_player_state(curr_player_id)
 
             if specified_tile:
                 if isinstance(specified_tile, str):
                     specified_tile = notation_to_idx(specified_tile)
 
+            if self.trajectory_sink is not None:
+                with self.profiler.phase("gc.trajectory"):
+                    self.trajectory_sink.record(self.env, curr_player_id, a)
+
             # step function
-            self.env.step(
-                curr_player_id,
-                a,
-            )  # TODO: specified_tile=specified_tile
-            self._update_player_infos()
+            with self.profiler.phase("env.step"):
+                self.env.step(
+                    curr_player_id,
+                    a,
+                )  # TODO: specified_tile=specified_tile
+            self._invalidate_player_states()
+            with self.profiler.phase("gc.update_player_infos"):
+                self._update_player_infos()
 
             # aftercare of the gameboard...
 
@@ -324,9 +547,11 @@ class MahjongGameCore(object):
             # ##########################################################################
 
             if a == MahjongEnv.ANKAN:
-                self._render_ankan_player_request(curr_player_id)
+                with self.profiler.phase("gc.render_calls"):
+                    self._render_ankan_player_request(curr_player_id)
             elif a == MahjongEnv.KAKAN:
-                self._render_kakan_player_request(curr_player_id, player_hand_dict_o)
+                with self.profiler.phase("gc.render_calls"):
+                    self._render_kakan_player_request(curr_player_id, player_state_o)
             # for win cases...
             elif a == MahjongEnv.TSUMO:
                 self.winners.append(curr_player_id)
@@ -341,7 +566,10 @@ class MahjongGameCore(object):
             #     MahjongEnv.RON,
             # ):  # last one to take the real effect. As we always discard a tile when make a call, that needn't be addressed
             if self.env.is_over():
-                self.calc_scores()
+                with self.profiler.phase("gc.calc_scores"):
+                    self.calc_scores()
+                if self.trajectory_sink is not None:
+                    self.trajectory_sink.end_round(self.payoffs)
         else:
             # reset
             if len(self.winners) > 0:
@@ -349,7 +577,8 @@ class MahjongGameCore(object):
             else:
                 change_oya = not self.check_tenpai(self.game_status["oya"])
 
-            self.reset(change_oya=change_oya, no_win=len(self.winners) == 0)
+            with self.profiler.phase("gc.reset"):
+                self.reset(change_oya=change_oya, no_win=len(self.winners) == 0)
 
     def calc_scores(self):
         payoffs = np.array(self.env.get_payoffs(), dtype=np.int32)
@@ -383,7 +612,8 @@ class MahjongGameCore(object):
 
         self.payoffs = payoffs
         self.game_status["cumulative_scores"] += payoffs
-        print(self.game_status["cumulative_scores"] + MahjongEnv.INIT_POINTS)
+        if self.verbose:
+            print(self.game_status["cumulative_scores"] + MahjongEnv.INIT_POINTS)
 
     def calc_final_scores(self) -> np.ndarray:
         # final scores: count riichibo
@@ -416,9 +646,15 @@ class MahjongGameCore(object):
 
     # information
     def get_dora_info_str(self) -> str:
+        n_active_dora = self.env.t.n_active_dora
         ret_str = (
             "寳牌指示: "
-            + print_dora_list(self.env.t.dora_indicator, self.env.t.n_active_dora)
+            + self.fragments.get(
+                "table",
+                "dora",
+                n_active_dora,
+                lambda: print_dora_list(self.env.t.dora_indicator, n_active_dora),
+            )
             + "\n"
         )
         if (
@@ -432,27 +668,66 @@ class MahjongGameCore(object):
             # riichi ron
             ret_str += (
                 "裏寳牌指示: "
-                + print_dora_list(
-                    self.env.t.uradora_indicator, self.env.t.n_active_dora
+                + self.fragments.get(
+                    "table",
+                    "uradora",
+                    n_active_dora,
+                    lambda: print_dora_list(
+                        self.env.t.uradora_indicator, n_active_dora
+                    ),
                 )
                 + "\n"
             )
         ret_str += "\n剩余: " + str(self.env.t.get_remain_tile())
         return ret_str
 
+    def get_dora_info_key(self) -> tuple:
+        """
+        Everything `get_dora_info_str` depends on: equal keys give the same string.
+        """
+        return (
+            self.env.t.n_active_dora,
+            self.env.t.get_remain_tile(),
+            self.env.is_over(),
+            tuple(self.winners),
+        )
+
+    def get_player_info_key(self, player_idx: int) -> tuple:
+        """
+        Everything `get_player_info_str` depends on: equal keys give the same string.
+        """
+        state = self.get_player_state(player_idx)
+        is_over = self.env.is_over()
+        return (
+            state.wind,
+            tuple(state.hand),
+            tuple(river_tile.raw for river_tile in state.river),
+            len(state.river) > 0 and state.river[-1].turn == self.current_turn,
+            tuple(
+                (calling.calling_str, calling.calling_type, calling.from_player)
+                for calling in self.player_calling_info[player_idx]
+            ),
+            state.riichi,
+            state.furiten,
+            int(self.game_status["cumulative_scores"][player_idx]),
+            not is_over and self.env.get_curr_player_id() == player_idx,
+            is_over,
+            tuple(self.winners),
+        )
+
     def get_player_info_str(self, player_idx: int) -> str:
-        player_hand_dict: dict = self.get_player_info(player_idx)
+        player_state = self.get_player_state(player_idx)
         player_calling_infos: List[CallingInfo] = self.player_calling_info[player_idx]
         game_status: dict = self.game_status
         # print row by row
-        ret = f"{WIND_TRANSLATION_TABLE[player_hand_dict['Wind'].lower()]}"
+        ret = f"{WIND_TRANSLATION_TABLE[player_state.wind]}"
         ret += "*" if self.env.get_curr_player_id() == player_idx else ""
 
         current_score = (
             game_status["cumulative_scores"][player_idx] + MahjongEnv.INIT_POINTS
         )
         if not self.env.is_over():
-            current_score -= player_hand_dict["Riichi"] * 1000
+            current_score -= player_state.riichi * 1000
         ret += f"\t{current_score}\n"
 
         mask_noneed = False
@@ -466,39 +741,71 @@ class MahjongGameCore(object):
             if self.env.t.players[player_idx].riichi:
                 mask_noneed = True
 
-            ret += (
-                print_hand(
-                    player_hand_dict["Hand"].split(),
-                    not (player_idx == 0 or mask_noneed),
-                )
-                + "\n"
-            )
+            mask_hand = not (player_idx == 0 or mask_noneed)
         else:
-            ret += (
-                print_hand(
-                    player_hand_dict["Hand"].split(),
-                    player_idx != 0,
-                )
-                + "\n"
+            mask_hand = player_idx != 0
+        fragments = self.fragments
+        hand = tuple(player_state.hand)
+        ret += (
+            fragments.get(
+                player_idx,
+                "hand",
+                (hand, mask_hand),
+                lambda: print_hand(player_state.hand, mask_hand),
             )
-        ret += ">" + print_callings(player_calling_infos) + "\n"
-        ret += print_river(player_hand_dict["River"].split(), self.current_turn)
-        ret += "リーチ " if player_hand_dict["Riichi"] else ""
+            + "\n"
+        )
+        ret += (
+            ">"
+            + fragments.get(
+                player_idx,
+                "calls",
+                tuple(calling.calling_type for calling in player_calling_infos),
+                lambda: print_callings(player_calling_infos),
+            )
+            + "\n"
+        )
+        river = player_state.river
+        ret += fragments.get(
+            player_idx,
+            "river",
+            (
+                len(river),
+                sum(river_tile.called for river_tile in river),
+                len(river) > 0 and river[-1].turn == self.current_turn,
+            ),
+            lambda: print_river(
+                [river_tile.raw for river_tile in river], self.current_turn
+            ),
+        )
+        ret += "リーチ " if player_state.riichi else ""
         if player_idx == 0 or mask_noneed:
-            tenpai = self.env.t.players[player_idx].tenpai_to_string()
-            if len(tenpai) > 0:
-                tenpai = [tenpai[i : i + 2] for i in range(0, len(tenpai), 2)]
-                tenpai = "".join(tile_exp(tile) for tile in tenpai)
-                ret += tenpai + " 待ち"
-                if player_hand_dict["Furiten"]:
-                    ret += " 振听"
+            waits = fragments.get(
+                player_idx,
+                "waits",
+                (hand, len(player_calling_infos)),
+                lambda: self._render_waits(player_idx),
+            )
+            ret += waits
+            if len(waits) > 0 and player_state.furiten:
+                ret += " 振听"
         ret += "\n"
         return ret
 
+    def _render_waits(self, player_idx: int) -> str:
+        tenpai = self.env.t.players[player_idx].tenpai_to_string()
+        if len(tenpai) == 0:
+            return ""
+        tenpai = [tenpai[i : i + 2] for i in range(0, len(tenpai), 2)]
+        return "".join(tile_exp(tile) for tile in tenpai) + " 待ち"
+
 
 # gc = MahjongGameCore()
 
 if __name__ == "__main__":
-    test_gc = MahjongGameCore(100)
+    with open("config/default.yaml", "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    test_gc = MahjongGameCore(config)
     while not test_gc.is_terminated():
         test_gc.step()
+    print(test_gc.calc_final_scores())
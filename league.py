@@ -0,0 +1,291 @@
+"""
+Round-robin league over a directory of checkpoints.
+
+Tables of four checkpoints are drawn so that every checkpoint plays about as often as the others and every two
+of them meet about equally often. Each table is played in all four seatings on the same walls (see
+`tournament.play_duplicate`), the tables are spread over a process pool, and each worker keeps the models it
+used most recently loaded. A multiplayer Elo rating is updated as the tables finish, in table order; as the
+model agents play deterministically (see `MajAgent.seed`), the same seed gives the same ratings however many
+workers play.
+
+    python league.py chkpt/ -j 8 --table league.json
+"""
+import os
+import glob
+import json
+import math
+import multiprocessing as mp
+from collections import OrderedDict
+from multiprocessing.util import Finalize
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import yaml
+
+from agent import MajAgent, unload_model
+from gamecore import MahjongGameCore
+from record import writer_path
+from tournament import play_duplicate
+from utils import spawn_seeds
+
+
+def list_checkpoints(directory: str) -> List[str]:
+    return sorted(glob.glob(os.path.join(directory, "*.pth")))
+
+
+def checkpoint_name(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def schedule_tables(n_agents: int, n_tables: int, rng: np.random.Generator) -> List[List[int]]:
+    """
+    `n_tables` tables of 4 distinct agents. Each seat of a table goes to the agent with the fewest tables so far,
+    then to the one that has met the agents already seated least often; the remaining ties are broken at random.
+    """
+    if n_agents < 4:
+        raise ValueError(f"a league needs at least 4 agents, got {n_agents}")
+    n_tables_played = np.zeros((n_agents,), dtype=np.int64)
+    meetings = np.zeros((n_agents, n_agents), dtype=np.int64)
+    tables = []
+    for _ in range(n_tables):
+        table = []
+        for _ in range(4):
+            met = meetings[table].sum(axis=0)
+            order = np.lexsort((rng.random(n_agents), met, n_tables_played))
+            table.append(int(next(i for i in order if i not in table)))
+        for i in table:
+            n_tables_played[i] += 1
+            meetings[i, table] += 1
+        tables.append(table)
+    return tables
+
+
+class ModelCache(object):
+    """
+    The `capacity` most recently used checkpoint agents of a process. Evicted models leave the model registry
+    unless another agent of the process has loaded them, so a league worker never holds more than `capacity`
+    of them however many checkpoints the league has.
+    """
+
+    def __init__(self, capacity: int = 8, backend: str = "eager") -> None:
+        super().__init__()
+        self.capacity = max(capacity, 4)  # the four agents of the current table
+        self.backend = backend
+        self.agents: "OrderedDict[str, MajAgent]" = OrderedDict()
+        self.n_loads = 0
+
+    def get(self, path: str) -> MajAgent:
+        agent = self.agents.pop(path, None)
+        if agent is None:
+            while len(self.agents) >= self.capacity:
+                _, old = self.agents.popitem(last=False)
+                old.unload()
+                unload_model(old.path)
+            # not the file name as agent type: a "random.pth" would play randomly
+            agent = MajAgent("checkpoint", path, backend=self.backend)
+            self.n_loads += 1
+        self.agents[path] = agent
+        return agent
+
+
+# One game core and model cache per worker process.
+_worker_gc: Optional[MahjongGameCore] = None
+_worker_models: Optional[ModelCache] = None
+
+
+def _init_worker(config: dict, cache_size: int, backend: str, pooled: bool = False):
+    global _worker_gc, _worker_models
+    if pooled and config.get("record"):
+        config = dict(config, record=writer_path(config["record"], os.getpid()))
+    # the seats are filled from the model cache for each table
+    _worker_gc = MahjongGameCore(dict(config, player="random", opponents=["random"] * 3))
+    _worker_models = ModelCache(cache_size, backend)
+    Finalize(_worker_gc, _worker_gc.close, exitpriority=16)
+
+
+def _play_table_task(task) -> Dict[str, list]:
+    table_idx, paths, seed = task
+    _worker_gc.agents = [_worker_models.get(path) for path in paths]
+    result = play_duplicate(_worker_gc, seed)
+    result["table"] = table_idx
+    result["agents"] = [checkpoint_name(path) for path in paths]
+    result["pid"] = os.getpid()
+    result["model_loads"] = _worker_models.n_loads  # of this worker so far
+    return result
+
+
+def run_league(
+    config: dict,
+    paths: List[str],
+    n_tables: int,
+    n_workers: int = 0,
+    seed: Optional[np.random.SeedSequence] = None,
+    cache_size: int = 8,
+    backend: str = "eager",
+) -> Iterator[Dict[str, list]]:
+    """
+    Play `n_tables` scheduled tables of the checkpoints in `paths` over a process pool and yield the results in
+    table order, as Elo updates depend on the order. The "ranks" of a result index its "agents".
+    """
+    config = dict(config)
+    config["verbose"] = False
+    if seed is None:
+        seed = config.get("seed")
+    schedule_seed, table_seed = spawn_seeds(seed, 2)
+    tables = schedule_tables(len(paths), n_tables, np.random.default_rng(schedule_seed))
+    tasks = [
+        (i, [paths[j] for j in table], table_seed_i)
+        for i, (table, table_seed_i) in enumerate(zip(tables, spawn_seeds(table_seed, n_tables)))
+    ]
+    if n_workers <= 0:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, n_tables)
+
+    if n_workers <= 1:
+        _init_worker(config, cache_size, backend)
+        try:
+            for task in tasks:
+                yield _play_table_task(task)
+        finally:
+            _worker_gc.close()
+        return
+
+    # no preloading: the workers only ever load the models of their own tables
+    pool = mp.Pool(n_workers, initializer=_init_worker, initargs=(config, cache_size, backend, True))
+    try:
+        yield from pool.imap(_play_table_task, tasks, chunksize=1)
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+class RatingTable(object):
+    """
+    Elo ratings for 4-player hanchans: a hanchan counts as a game between every two of its players, won by the
+    higher rank, and the K-factor is shared among the three games of each player.
+    """
+
+    def __init__(self, names: List[str], k: float = 16.0, initial: float = 1500.0) -> None:
+        super().__init__()
+        self.k = k
+        self.ratings = dict.fromkeys(names, initial)
+        self.n_hanchans = dict.fromkeys(names, 0)
+        self.total_pt = dict.fromkeys(names, 0.0)
+        self.total_rank = dict.fromkeys(names, 0)
+
+    def update(self, ranked: List[str], pts: List[float]):
+        """
+        One hanchan: the players from first to last and their pt.
+        """
+        n = len(ranked)
+        ratings = [self.ratings[name] for name in ranked]
+        scores = [0.0] * n  # actual minus expected wins
+        for i in range(n):
+            for j in range(i + 1, n):
+                expected = 1 / (1 + 10 ** ((ratings[j] - ratings[i]) / 400))
+                scores[i] += 1 - expected
+                scores[j] -= 1 - expected
+        for rank, (name, pt) in enumerate(zip(ranked, pts)):
+            self.ratings[name] += self.k / (n - 1) * scores[rank]
+            self.n_hanchans[name] += 1
+            self.total_pt[name] += pt
+            self.total_rank[name] += rank + 1
+
+    def add_result(self, result: Dict[str, list]):
+        for rotation in result["rotations"]:
+            self.update([result["agents"][idx] for idx in rotation["ranks"]], rotation["pt"])
+
+    def rows(self) -> List[dict]:
+        rows = []
+        for name, rating in sorted(self.ratings.items(), key=lambda item: -item[1]):
+            n = self.n_hanchans[name]
+            rows.append(
+                {
+                    "name": name,
+                    "rating": round(rating, 1),
+                    "n_hanchans": n,
+                    "mean_pt": round(self.total_pt[name] / n, 2) if n else None,
+                    "mean_rank": round(self.total_rank[name] / n, 3) if n else None,
+                }
+            )
+        return rows
+
+    def format(self) -> str:
+        lines = [f"{'':>4}{'checkpoint':<32}{'rating':>9}{'hanchans':>10}{'mean pt':>10}{'mean rank':>11}"]
+        for i, row in enumerate(self.rows()):
+            if row["n_hanchans"] == 0:
+                lines.append(f"{i + 1:>4}{row['name']:<32}{row['rating']:>9.1f}{0:>10}")
+                continue
+            lines.append(
+                f"{i + 1:>4}{row['name']:<32}{row['rating']:>9.1f}{row['n_hanchans']:>10}"
+                f"{row['mean_pt']:>10.2f}{row['mean_rank']:>11.3f}"
+            )
+        return "\n".join(lines)
+
+
+def write_table(path: str, table: RatingTable, **meta):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(meta, ratings=table.rows()), f, indent=2)
+    os.replace(tmp_path, path)  # readers never see a half-written table
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument("checkpoint_dir", type=str, help="directory of the .pth checkpoints")
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument(
+        "--meetings", type=float, default=None, help="how often each two checkpoints meet on average"
+    )
+    parser.add_argument("--n_workers", "-j", type=int, default=None, help="number of processes")
+    parser.add_argument("--cache_size", type=int, default=None, help="models kept loaded per worker")
+    parser.add_argument("--backend", type=str, default="eager", help="inference backend of every checkpoint")
+    parser.add_argument("--seed", "-s", type=int, default=None, help="root seed of the schedule and all tables")
+    parser.add_argument("--output", "-o", type=str, default=None, help="jsonl file of the results")
+    parser.add_argument("--table", type=str, default=None, help="json rating table, rewritten after each table")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    league_config = config.get("league", {})
+    meetings = args.meetings or league_config.get("meetings", 1)
+    n_workers = args.n_workers if args.n_workers is not None else league_config.get("n_workers", 0)
+    cache_size = args.cache_size or league_config.get("cache_size", 8)
+
+    paths = list_checkpoints(args.checkpoint_dir)
+    if len(paths) < 4:
+        raise SystemExit(f"{args.checkpoint_dir} holds {len(paths)} checkpoints, a league needs at least 4")
+    # a table covers 6 of the n (n - 1) / 2 pairs
+    n_tables = max(1, math.ceil(meetings * len(paths) * (len(paths) - 1) / 12))
+
+    seed = np.random.SeedSequence(args.seed if args.seed is not None else config.get("seed"))
+    table = RatingTable([checkpoint_name(path) for path in paths], k=league_config.get("k", 16))
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    n_done = 0
+    for result in run_league(config, paths, n_tables, n_workers, seed, cache_size, args.backend):
+        table.add_result(result)
+        n_done += 1
+        line = json.dumps(result)
+        print(line)
+        if out is not None:
+            out.write(line + "\n")
+            out.flush()
+        if args.table is not None:
+            write_table(args.table, table, n_tables=n_done, n_scheduled=n_tables, seed=seed.entropy)
+    if out is not None:
+        out.close()
+    print(table.format())
+    print(json.dumps({"n_tables": n_done, "seed": seed.entropy}))  # rerun with -s to reproduce
@@ -0,0 +1,105 @@
+from collections import defaultdict
+from typing import List
+
+import yaml
+
+from utils import REMOVE_TILE_MARKS
+
+# YAML 1.1 booleans emitted by `Player.to_string()` (e.g. "Riichi: No")
+_YAML_BOOLS = {
+    "yes": True,
+    "no": False,
+    "true": True,
+    "false": False,
+    "on": True,
+    "off": False,
+}
+
+# fields whose empty value should still be usable as a string (`.split()`)
+_STR_FIELDS = ("Hand", "River", "Calls")
+
+
+def _parse_scalar(value: str):
+    if value == "":
+        return None
+    lowered = value.lower()
+    if lowered in _YAML_BOOLS:
+        return _YAML_BOOLS[lowered]
+    if value.lstrip("-").isdigit():
+        return int(value)
+    return value
+
+
+def parse_player_string(raw: str) -> dict:
+    """
+    Parse the flat `Key: value` document of `Player.to_string()`.
+
+    Gives the same result as `yaml.load(raw, Loader=yaml.FullLoader)` for the documents the engine emits,
+    falling back to yaml for anything that is not a flat mapping.
+    """
+    ret = {}
+    for line in raw.splitlines():
+        if not line or line.isspace():
+            continue
+        key, sep, value = line.partition(":")
+        if not sep or line[0].isspace() or value[:1] not in ("", " "):
+            return yaml.load(raw, Loader=yaml.FullLoader)
+        ret[key.strip()] = _parse_scalar(value.strip())
+    return ret
+
+
+class RiverTile(object):
+    """
+    One river entry, e.g. "3m12rh-": tile, turn, then the riichi / from hand / called marks.
+    """
+
+    __slots__ = ("raw", "tile", "turn", "riichi", "from_hand", "called")
+
+    def __init__(self, raw: str) -> None:
+        marks = raw[2:]
+        turn = marks.translate(REMOVE_TILE_MARKS)
+        assert turn.isdigit(), raw
+        self.raw = raw
+        self.tile = raw[:2]
+        self.turn = int(turn)
+        self.riichi = "r" in marks
+        self.from_hand = "h" in marks
+        self.called = "-" in marks
+
+    def __repr__(self) -> str:
+        return f"RiverTile({self.raw!r})"
+
+
+class PlayerState(object):
+    """
+    Structured state of one player at a decision point.
+
+    `info` keeps the legacy dict layout of `MahjongGameCore.get_player_info`.
+    """
+
+    __slots__ = ("info", "hand", "river", "calls", "riichi", "furiten", "wind")
+
+    def __init__(self, info: dict) -> None:
+        self.info = info
+        self.hand: List[str] = info["Hand"].split()
+        self.river: List[RiverTile] = [RiverTile(t) for t in info["River"].split()]
+        self.calls: List[str] = info["Calls"].split()
+        self.riichi = bool(info["Riichi"])
+        self.furiten = bool(info["Furiten"])
+        self.wind = str(info["Wind"]).lower()
+
+    @classmethod
+    def from_player(cls, player) -> "PlayerState":
+        info = defaultdict(str)
+        info.update(parse_player_string(player.to_string()))
+        for key in _STR_FIELDS:
+            if info[key] is None:
+                info[key] = ""
+        info["Furiten"] = (
+            player.riichi_furiten or player.sutehai_furiten or player.toujun_furiten
+        )
+        return cls(info)
+
+    @property
+    def last_turn(self) -> int:
+        return self.river[-1].turn if len(self.river) > 0 else -1
@@ -0,0 +1,182 @@
+"""
+Opt-in timing of the game loop phases.
+
+    with PROFILER.phase("env.step"):
+        ...
+
+While the profiler is disabled `phase` returns a shared no-op context manager, so the instrumentation can stay
+in production code. When enabled, every phase is aggregated into a counter and a log2 latency histogram and,
+if tracing, recorded as an event of a Chrome trace (chrome://tracing, https://ui.perfetto.dev).
+
+`STARTUP` keeps the milestones of the process start (imports, first frame, first step), measured from the import
+of this module, which the entry points import first.
+"""
+import os
+import json
+import time
+import threading
+from collections import defaultdict
+from typing import Dict, List
+
+N_BUCKETS = 32  # bucket i: [2^(i-1), 2^i) us
+
+
+class _NullPhase(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class _Phase(object):
+    __slots__ = ("profiler", "name", "t0")
+
+    def __init__(self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.add(self.name, self.t0, time.perf_counter_ns())
+        return False
+
+
+class PhaseStats(object):
+    __slots__ = ("count", "total_ns", "max_ns", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * N_BUCKETS
+
+    def add(self, dur_ns: int):
+        self.count += 1
+        self.total_ns += dur_ns
+        self.max_ns = max(self.max_ns, dur_ns)
+        self.histogram[min((dur_ns // 1000).bit_length(), N_BUCKETS - 1)] += 1
+
+    def percentile(self, q: float) -> float:
+        # upper bound (us) of the histogram bucket holding the q-th percentile
+        rank, seen = q / 100 * self.count, 0
+        for i, n in enumerate(self.histogram):
+            seen += n
+            if seen >= rank and n > 0:
+                return float(2**i)
+        return 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "total_ms": round(self.total_ns / 1e6, 3),
+            "mean_us": round(self.total_ns / max(self.count, 1) / 1e3, 2),
+            "max_us": round(self.max_ns / 1e3, 2),
+            "p50_us_le": self.percentile(50),
+            "p99_us_le": self.percentile(99),
+        }
+
+
+class Profiler(object):
+    def __init__(self, enabled: bool = False, trace: bool = False, max_events: int = 1_000_000) -> None:
+        super().__init__()
+        self.enabled = enabled
+        self.trace = trace
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.stats: Dict[str, PhaseStats] = defaultdict(PhaseStats)
+        self.events: List[tuple] = []  # name, tid, start ns, end ns
+        self._t_origin = time.perf_counter_ns()
+
+    def enable(self, trace: bool = False):
+        self.enabled = True
+        self.trace = trace
+
+    def disable(self):
+        self.enabled = False
+
+    def phase(self, name: str):
+        if not self.enabled:
+            return _NULL_PHASE
+        return _Phase(self, name)
+
+    def add(self, name: str, t0: int, t1: int):
+        with self._lock:
+            self.stats[name].add(t1 - t0)
+            if self.trace and len(self.events) < self.max_events:
+                self.events.append((name, threading.get_ident(), t0, t1))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {name: st.summary() for name, st in sorted(self.stats.items())}
+
+    def format_summary(self) -> str:
+        lines = [f"{'phase':<28}{'count':>9}{'total ms':>12}{'mean us':>10}{'max us':>10}"]
+        for name, st in self.summary().items():
+            lines.append(
+                f"{name:<28}{st['count']:>9}{st['total_ms']:>12.1f}{st['mean_us']:>10.1f}{st['max_us']:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str):
+        pid = os.getpid()
+        with self._lock:
+            trace_events = [
+                {
+                    "name": name,
+                    "ph": "X",
+                    "pid": pid,
+                    "tid": tid,
+                    "ts": (t0 - self._t_origin) / 1e3,
+                    "dur": (t1 - t0) / 1e3,
+                }
+                for name, tid, t0, t1 in self.events
+            ]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, f)
+
+
+# process-wide profiler, enabled by `QPMJ_PROFILE=1` (`QPMJ_PROFILE=trace` also records the timeline)
+PROFILER = Profiler(
+    enabled=os.environ.get("QPMJ_PROFILE", "") not in ("", "0"),
+    trace=os.environ.get("QPMJ_PROFILE", "") == "trace",
+)
+
+
+class StartupTimer(object):
+    def __init__(self) -> None:
+        super().__init__()
+        self.t0 = time.perf_counter()
+        self.marks: Dict[str, float] = {}  # s since t0, first occurrence only
+        self.durations: Dict[str, float] = {}  # s
+
+    def mark(self, name: str):
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.t0
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {
+            "marks_ms": {name: round(t * 1e3, 1) for name, t in self.marks.items()},
+            "durations_ms": {name: round(t * 1e3, 1) for name, t in self.durations.items()},
+        }
+
+    def write(self, path: str, **meta):
+        # one json line per run, so a file tracks the startup of several configurations and builds
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(meta, **self.report())) + "\n")
+
+
+STARTUP = StartupTimer()
@@ -1,7 +1,8 @@
 import sys
 import typing
 
-from PyQt6.QtCore import QObject, QSize, Qt, QTimer, QThread, pyqtSignal
+from profiling import PROFILER, STARTUP  # first, so that the startup report covers the imports below
+from PyQt6.QtCore import QObject, QSize, Qt, QTimer, QThread, pyqtSignal, pyqtSlot
 from PyQt6.QtWidgets import (
     QApplication,
     QMainWindow,
@@ -15,7 +16,7 @@ from PyQt6.QtWidgets import (
 )
 
 from pymahjong import MahjongEnv
-import time
+from collections import deque
 from functools import partial
 from typing import Union, List
 import numpy as np
@@ -25,12 +26,16 @@ from ui_utils import print_game_status, print_curr_scores, print_detailed_winner
 from enum import IntEnum
 
 from gamecore import MahjongGameCore
+from shanten import get_tables as get_shanten_tables
+
+STARTUP.mark("imports")
 
 
 class GameSignalType(IntEnum):
     current_player_response = 200
     is_over = -1024
     running = 255
+    terminated = -2048
 
 
 DELAY = 1.5  # seconds
@@ -51,12 +56,30 @@ def parse_args():
     parser.add_argument(
         "--fast_through", "-f", action="store_true", help="fast terminate"
     )
+    parser.add_argument(
+        "--profile",
+        "-p",
+        type=str,
+        default=None,
+        help="time the engine and rendering, and write a Chrome trace to the given path on exit",
+    )
+    parser.add_argument(
+        "--startup_report",
+        type=str,
+        default=None,
+        help="start the game at once and append the startup milestones to the given jsonl file on exit",
+    )
     args = parser.parse_args()
     return args
 
 
 # Subclass QMainWindow to customize your application's main window
 class MainWindow(QMainWindow):
+    # commands to the engine worker (queued across threads)
+    start_requested = pyqtSignal()
+    action_requested = pyqtSignal(int)
+    continue_requested = pyqtSignal()
+
     def __init__(self, config: dict, qsize=(1350, 800), font_sizes=(18, 14, 16)):
         super().__init__()
         self.config = config
@@ -92,6 +115,7 @@ class MainWindow(QMainWindow):
         self.init_button.clicked.connect(self.init_game)
 
         self.signal_list = []
+        self.worker_thread = None  # started with the game
         self._render_layout()
 
     @staticmethod
@@ -135,6 +159,17 @@ class MainWindow(QMainWindow):
             tile.setText(ACTION_TRANSLATION_TABLE[i])
             tile.clicked.connect(partial(self.run, i, True))
 
+        # "shanten·effective tiles" under each tile while choosing a discard
+        self.hint_labels = []
+        for tile in self.action_buttons[: MahjongEnv.MAHJONG_TILE_TYPES]:
+            hint = QLabel(tile)
+            hint.setGeometry(0, 36, 35, 14)
+            hint.setAlignment(Qt.AlignmentFlag.AlignCenter)
+            hint.setStyleSheet("background: transparent")
+            hint.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+            self._set_font(hint, 8)
+            self.hint_labels.append(hint)
+
         # fill the rest two boxes
         self.status_label = [QLabel(), QLabel()]
         self.tiles_layout.addWidget(
@@ -173,34 +208,98 @@ class MainWindow(QMainWindow):
         self.setCentralWidget(self.widget)
 
     def init_game(self):
+        STARTUP.mark("game_requested")
         self.init_button.setEnabled(False)
         self.init_button.setText("")
         self.init_button.setVisible(False)
-        self.run()
-
-    def render(self):
-        # time.sleep(0.3)
-        # Option on display the core
-        is_over = self.gc.env.is_over()
-
-        # dora on left up
-        # first row
-        self.info_labels[0].setText(self.gc.get_dora_info_str())
+        self.init_button.clicked.disconnect(self.init_game)
+        self.init_button.clicked.connect(self.continue_game)
+
+        self._set_buttons_for_options()
+
+        # the engine lives in its own thread for the whole session, commands reach it as queued signals
+        self.snapshots = deque()
+        self._waited = False
+        self.anim_timer = QTimer(self)
+        self.anim_timer.setSingleShot(True)
+        self.anim_timer.timeout.connect(self._play_snapshots)
+
+        self.worker_thread = QThread()
+        self.worker = GameWorker(self.config, args.fast_through)
+        self.worker.moveToThread(self.worker_thread)
+        self.worker.snapshot.connect(self.receive_snapshot)
+        self.start_requested.connect(self.worker.start)
+        self.action_requested.connect(self.worker.human_action)
+        self.continue_requested.connect(self.worker.continue_round)
+        self.worker_thread.start()
+        self.start_requested.emit()
+
+    def continue_game(self):
+        self.init_button.setEnabled(False)
+        self.init_button.setVisible(False)
+        self.continue_requested.emit()
 
-        self.info_labels[2].setText(print_game_status(self.gc.game_status))
-        self.info_labels[1].setText(self.gc.get_player_info_str(2))
+    def run(self, action: int, on_click=False):
+        # clear status
+        for bt in self.action_buttons:
+            bt.setEnabled(False)
+        self._set_discard_hints({})
+        for lb in self.status_label:
+            lb.setText("")
+        self.action_requested.emit(action)
+
+    def receive_snapshot(self, snapshot: "GameSnapshot"):
+        self.snapshots.append(snapshot)
+        if not self.anim_timer.isActive():
+            self._play_snapshots()
+
+    def _play_snapshots(self):
+        # AI moves are shown `DELAY` apart, everything else as soon as it arrives
+        while len(self.snapshots) > 0:
+            snapshot = self.snapshots[0]
+            if snapshot.paced and not self._waited:
+                self._waited = True
+                self.anim_timer.start(int(DELAY * 1000))
+                return
+            self.snapshots.popleft()
+            self._waited = False
+            self.render(snapshot)
+            self._handle_snapshot(snapshot)
+
+    def render(self, snapshot: "GameSnapshot"):
+        with PROFILER.phase("ui.render"):
+            for idx, text in snapshot.labels.items():
+                self.info_labels[idx].setText(text)
+            # coalesced with other pending paint events instead of a synchronous repaint
+            self.update()
+        STARTUP.mark("first_frame")
+
+    def _handle_snapshot(self, snapshot: "GameSnapshot"):
+        if snapshot.kind == GameSignalType.current_player_response:
+            self._set_avail_buttons(snapshot.valid_actions)
+            self._set_discard_hints(snapshot.hints)
+        elif snapshot.kind == GameSignalType.is_over:
+            self._display_win_info(snapshot.info)
+            self.init_button.setText("Continue?")
+            self.init_button.setEnabled(True)
+            self.init_button.setVisible(True)
+        elif snapshot.kind == GameSignalType.terminated:
+            self._display_end_of_game(snapshot.info)
+            self._stop_worker()
+            sys.exit(0)
 
-        # second row
-        self.info_labels[3].setText(self.gc.get_player_info_str(3))
-        if is_over:
-            self.info_labels[4].setText(print_curr_scores(self.gc.payoffs))
-        else:
-            self.info_labels[4].setText("")
-        self.info_labels[5].setText(self.gc.get_player_info_str(1))
+    def _stop_worker(self):
+        # once the engine thread is idle, the record and the trajectory sink get the rounds they still buffer
+        if self.worker_thread is None:
+            return
+        self.worker_thread.quit()
+        self.worker_thread.wait()
+        self.worker_thread = None
+        self.worker.close()
 
-        self.info_labels[6].setText(self.gc.get_player_info_str(0))
-
-        self.repaint()
+    def closeEvent(self, event):
+        self._stop_worker()  # closing mid-game keeps the round in progress too
+        super().closeEvent(event)
 
     def _set_avail_buttons(self, actions: Union[List[int], np.ndarray]):
         for i in actions:
@@ -219,18 +318,23 @@ class MainWindow(QMainWindow):
         if MahjongEnv.KAKAN in actions or MahjongEnv.ANKAN in actions:
             self.status_label[1].setText("カンる？")
 
-    def _display_end_of_game(self):
+    def _set_discard_hints(self, hints: dict):
+        best = min(hints.values(), key=lambda h: (h[0], -h[1])) if hints else None
+        for i, hint in enumerate(self.hint_labels):
+            if i not in hints:
+                hint.setText("")
+                self.action_buttons[i].setToolTip("")
+                continue
+            shanten, n_effective = hints[i]
+            hint.setText(f"{shanten}·{n_effective}")
+            self._set_font(hint, 8, bold=hints[i] == best)
+            self.action_buttons[i].setToolTip(
+                "和了" if shanten < 0 else f"{'聴牌' if shanten == 0 else f'{shanten}向聴'} / 受け入れ {n_effective}枚"
+            )
+
+    def _display_end_of_game(self, set_str: str):
         self.init_button.setEnabled(False)
         self.init_button.setVisible(False)
-        displayed_scores, displayed_sequence = self.gc.calc_final_scores()
-        set_str = ""
-
-        for ranking, (idx, score) in enumerate(
-            zip(displayed_sequence, displayed_scores)
-        ):
-            set_str += f"Ranking {ranking}: Player {idx}, score={self.gc.game_status['cumulative_scores'][idx]}, pt={score:.1f}\n"
-
-        set_str += "The game has ended.\nTo start a new game, restart the program."
         # self.info_labels[4].setText(set_str)
         qbox = QMessageBox()
         qbox.setBaseSize(100, 50)
@@ -241,20 +345,7 @@ class MainWindow(QMainWindow):
         qbox.exec()
         self.repaint()
 
-    def _display_win_info(self):
-        off_result = self.gc.env.t.get_result()
-        info_str = ""
-        if len(self.gc.winners) > 0:
-            for player_idx in self.gc.winners:
-                info_str += print_detailed_winner_info(
-                    player_idx,
-                    off_result.results[player_idx],
-                    off_result.result_type.value == 1,
-                    player_idx == self.gc.game_status["oya"],
-                )
-
-        else:
-            info_str = "流局 结算"
+    def _display_win_info(self, info_str: str):
         qbox = QMessageBox()
         qbox.setBaseSize(100, 50)
         self._set_font(qbox)
@@ -263,69 +354,167 @@ class MainWindow(QMainWindow):
         # qbox.setStandardButtons(QMessageBox.Ok)
         qbox.exec()
 
-    def run(self, action=None, on_click=False):
-        if not hasattr(self, "gc"):
-            self.gc = MahjongGameCore(self.config)
-            self._set_buttons_for_options()
-            self.render()
-        elif self.gc.env.is_over():
-            self.gc.step()
-            self.render()
 
-        if self.gc.is_terminated():
-            self._display_end_of_game()
-            sys.exit(0)
+class GameSnapshot(object):
+    """
+    What the GUI needs to show one engine state: the label texts that changed since the previous snapshot,
+    and depending on `kind`, the human's valid actions or the text of the result box.
+    """
 
-        # clear status
-        for bt in self.action_buttons:
-            bt.setEnabled(False)
-        for lb in self.status_label:
-            lb.setText("")
+    __slots__ = ("kind", "labels", "valid_actions", "hints", "info", "paced")
+
+    def __init__(self, kind: GameSignalType, labels: dict, paced: bool = False) -> None:
+        self.kind = kind
+        self.labels = labels
+        self.valid_actions = None
+        self.hints = {}  # tile index -> (shanten, effective tiles) of each discard
+        self.info = ""
+        self.paced = paced
 
-        if on_click:
-            self.gc.step(action=action)
-            self.render()
-        self.gt = GameRunThread(self.gc)
-        self.gt.render.connect(self.receive_render_command)
-        self.gt.start()
-
-    def receive_render_command(self, sigval: GameSignalType):
-        if sigval == GameSignalType.current_player_response:
-            self._set_avail_buttons(self.gc.env.get_valid_actions())
-        elif sigval == GameSignalType.is_over:
-            self._display_win_info()
-            self.init_button.setText("Continue?")
-            self.init_button.setEnabled(True)
-            self.init_button.setVisible(True)
-        self.render()
 
+class GameWorker(QObject):
+    """
+    Owns the `MahjongGameCore` in the worker thread. Plays AI moves as fast as possible after each command
+    and pushes a `GameSnapshot` per step; pacing is left to the GUI.
+    """
 
-class GameRunThread(QThread):
-    render = pyqtSignal(GameSignalType)
+    snapshot = pyqtSignal(object)
 
-    def __init__(self, gc: MahjongGameCore) -> None:
+    def __init__(self, config: dict, fast_through: bool = False) -> None:
         super().__init__()
-        self.gc = gc
+        self.config = config
+        self.fast_through = fast_through
+        self.gc = None
+        self._label_keys = [None] * 7  # what each label currently shows
+
+    def _set_label(self, labels: dict, idx: int, key, get_text):
+        # only relabel when what the text depends on has changed
+        if key != self._label_keys[idx]:
+            self._label_keys[idx] = key
+            labels[idx] = get_text()
+
+    def _render_labels(self) -> dict:
+        labels = {}
+        gc = self.gc
+        is_over = gc.env.is_over()
+
+        # dora on left up
+        # first row
+        self._set_label(labels, 0, gc.get_dora_info_key(), gc.get_dora_info_str)
 
-    def run(self):
-        if self.gc.env.get_curr_player_id() in [1, 2, 3]:
-            time.sleep(DELAY)
+        game_status = gc.game_status
+        self._set_label(
+            labels,
+            2,
+            (
+                game_status["game_wind"],
+                game_status["game_count"],
+                game_status["honba"],
+                game_status["riichibo"],
+            ),
+            partial(print_game_status, game_status),
+        )
+        # second row
+        if is_over:
+            self._set_label(
+                labels,
+                4,
+                tuple(gc.payoffs),
+                partial(print_curr_scores, gc.payoffs),
+            )
+        else:
+            self._set_label(labels, 4, None, str)
+
+        # players 2, 3, 1, 0
+        for label_idx, player_idx in ((1, 2), (3, 3), (5, 1), (6, 0)):
+            self._set_label(
+                labels,
+                label_idx,
+                gc.get_player_info_key(player_idx),
+                partial(gc.get_player_info_str, player_idx),
+            )
+        return labels
+
+    def _emit(self, kind: GameSignalType, paced: bool = False) -> GameSnapshot:
+        with PROFILER.phase("worker.render"):
+            snapshot = GameSnapshot(kind, self._render_labels(), paced)
+        if kind == GameSignalType.current_player_response:
+            snapshot.valid_actions = self.gc.env.get_valid_actions()
+            if snapshot.valid_actions[0] < MahjongEnv.MAHJONG_TILE_TYPES and not self.gc.env.riichi_stage2:
+                with PROFILER.phase("worker.discard_hints"):
+                    snapshot.hints = self.gc.get_discard_hints(0)
+        elif kind == GameSignalType.is_over:
+            snapshot.info = self._win_info()
+        elif kind == GameSignalType.terminated:
+            snapshot.info = self._final_info()
+        self.snapshot.emit(snapshot)
+        return snapshot
+
+    def _win_info(self) -> str:
+        off_result = self.gc.env.t.get_result()
+        info_str = ""
+        if len(self.gc.winners) > 0:
+            for player_idx in self.gc.winners:
+                info_str += print_detailed_winner_info(
+                    player_idx,
+                    off_result.results[player_idx],
+                    off_result.result_type.value == 1,
+                    player_idx == self.gc.game_status["oya"],
+                )
+        else:
+            info_str = "流局 结算"
+        return info_str
+
+    def _final_info(self) -> str:
+        displayed_scores, displayed_sequence = self.gc.calc_final_scores()
+        set_str = ""
+
+        for ranking, (idx, score) in enumerate(
+            zip(displayed_sequence, displayed_scores)
+        ):
+            set_str += f"Ranking {ranking}: Player {idx}, score={self.gc.game_status['cumulative_scores'][idx]}, pt={score:.1f}\n"
+
+        set_str += "The game has ended.\nTo start a new game, restart the program."
+        return set_str
+
+    def _advance(self):
+        # play until a human decision, the end of the round or the end of the game
         while not self.gc.is_terminated():
-            if self.gc.env.get_curr_player_id() == 0:
-                if args.fast_through:
-                    self.gc.step()
-                    self.render.emit(GameSignalType.running)
-                else:
-                    self.render.emit(GameSignalType.current_player_response)
-                    break
-            elif self.gc.env.get_curr_player_id() == -1:
-                self.render.emit(GameSignalType.is_over)
-                break
-            else:
-                self.gc.step()
-                self.render.emit(GameSignalType.running)
-                if self.gc.env.get_curr_player_id() not in (0, -1):
-                    time.sleep(DELAY)
+            if self.gc.env.is_over():
+                self._emit(GameSignalType.is_over)
+                return
+            curr_player_id = self.gc.env.get_curr_player_id()
+            if curr_player_id == 0 and not self.fast_through:
+                self._emit(GameSignalType.current_player_response)
+                return
+            self.gc.step()
+            self._emit(GameSignalType.running, paced=curr_player_id != 0)
+        self._emit(GameSignalType.terminated)
+
+    @pyqtSlot()
+    def start(self):
+        self.gc = MahjongGameCore(self.config)
+        self._emit(GameSignalType.running)
+        get_shanten_tables()  # built once, after the first frame and before the first discard hints
+        self._advance()
+
+    @pyqtSlot(int)
+    def human_action(self, action: int):
+        self.gc.step(action=action)
+        self._emit(GameSignalType.running)
+        self._advance()
+
+    @pyqtSlot()
+    def continue_round(self):
+        self.gc.step()  # next round, or the end of the game
+        if not self.gc.is_terminated():
+            self._emit(GameSignalType.running)
+        self._advance()
+
+    def close(self):
+        # only once the worker thread has stopped
+        if self.gc is not None:
+            self.gc.close()
 
 
 if __name__ == "__main__":
@@ -339,10 +528,35 @@ if __name__ == "__main__":
     if args.fast_through:
         DELAY = 0.1
 
+    if args.profile:
+        import atexit
+
+        PROFILER.enable(trace=True)
+
+        def dump_profile():
+            print(PROFILER.format_summary())
+            PROFILER.export_chrome_trace(args.profile)
+
+        atexit.register(dump_profile)
+
     app = QApplication(sys.argv)
 
     window = MainWindow(config)
     window.show()
+    STARTUP.mark("window_shown")
+
+    if args.startup_report:
+        import atexit
+
+        def dump_startup():
+            STARTUP.write(
+                args.startup_report,
+                config=args.config,
+                opponents=list(config["opponents"]),
+            )
+
+        atexit.register(dump_startup)
+        QTimer.singleShot(0, window.init_game)  # no click, so the game milestones are comparable
 
     # Start the event loop.
     sys.exit(app.exec())
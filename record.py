@@ -0,0 +1,166 @@
+"""
+Binary game records.
+
+`<path>` is an append-only stream of rounds, each written as a round header (seed, oya, game wind)
+followed by 2 bytes per action:
+    byte 0: player id in the lowest 2 bits, (An-Kan / Ka-Kan tile id + 1) in the upper 6 bits
+    byte 1: action index of `MahjongEnv`
+`<path>.idx` holds one fixed-size entry per finished round and can be memory mapped for random access.
+"""
+import os
+import struct
+import mmap
+from typing import Union
+
+import numpy as np
+from pymahjong import MahjongEnv
+
+MAGIC = b"QPMJREC1"
+WINDS = ["east", "south", "west", "north"]
+
+ROUND_HEADER = struct.Struct("<qBB")  # seed, oya, wind index
+INDEX_DTYPE = np.dtype(
+    [
+        ("offset", "<u8"),  # of the round header in the record file
+        ("n_actions", "<u4"),
+        ("seed", "<i8"),
+        ("oya", "u1"),
+        ("wind", "u1"),
+    ]
+)
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+def writer_path(path: str, writer: Union[int, str]) -> str:
+    """
+    The record file of one of several game cores recording at once, e.g. the workers of a pool:
+    games.rec -> games.<writer>.rec. Writers never share a file, as each keeps its own offsets into it.
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{writer}{ext}"
+
+
+class GameRecorder(object):
+    """
+    Attach to `MahjongEnv.recorder` (or `MahjongGameCore.attach_recorder`) to log every round.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._f = open(path, "ab")
+        if new_file:
+            self._f.write(MAGIC)
+        self._idx = open(index_path(path), "ab")
+        self._round = None  # index entry of the round being recorded
+        self._actions = bytearray()
+
+    def begin_round(self, seed: int, oya: int, game_wind: str):
+        self.end_round()
+        wind = WINDS.index(game_wind)
+        self._round = (self._f.tell(), seed, oya, wind)
+        self._f.write(ROUND_HEADER.pack(seed, oya, wind))
+        self._actions = bytearray()
+
+    def record(self, player_id: int, action: int, kan_tile: Union[int, None] = None):
+        tile_code = 0 if kan_tile is None else int(kan_tile) + 1
+        self._actions.append(player_id | tile_code << 2)
+        self._actions.append(action)
+
+    def end_round(self):
+        if self._round is None:
+            return
+        offset, seed, oya, wind = self._round
+        self._f.write(self._actions)
+        self._f.flush()
+        entry = np.array(
+            [(offset, len(self._actions) // 2, seed, oya, wind)], dtype=INDEX_DTYPE
+        )
+        self._idx.write(entry.tobytes())
+        self._idx.flush()
+        self._round = None
+
+    def close(self):
+        self.end_round()
+        self._f.close()
+        self._idx.close()
+
+
+class RoundRecord(object):
+    def __init__(self, seed: int, oya: int, game_wind: str, actions: np.ndarray) -> None:
+        super().__init__()
+        self.seed = seed
+        self.oya = oya
+        self.game_wind = game_wind
+        self.actions = actions  # (n, 2) uint8, see the module docstring
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+    def decoded_actions(self):
+        """
+        (player_id, action, kan_tile or None) of each step.
+        """
+        for code, action in self.actions:
+            tile_code = int(code) >> 2
+            yield int(code) & 3, int(action), tile_code - 1 if tile_code else None
+
+
+class GameRecord(object):
+    """
+    Random access to the rounds of a record file through its memory mapped index.
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self.path = path
+        self._f = open(path, "rb")
+        self._data = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        assert self._data[: len(MAGIC)] == MAGIC, f"{path} is not a game record"
+        if os.path.getsize(index_path(path)) > 0:
+            self.index = np.memmap(index_path(path), dtype=INDEX_DTYPE, mode="r")
+        else:
+            self.index = np.zeros((0,), dtype=INDEX_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __getitem__(self, i: int) -> RoundRecord:
+        entry = self.index[i]
+        start = int(entry["offset"]) + ROUND_HEADER.size
+        # a copy of the few bytes, so that rounds outlive the mapping and never keep `close` from unmapping it
+        actions = np.frombuffer(
+            self._data[start : start + 2 * int(entry["n_actions"])], dtype=np.uint8
+        ).reshape(-1, 2)
+        return RoundRecord(
+            int(entry["seed"]), int(entry["oya"]), WINDS[int(entry["wind"])], actions
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        self.index = None
+        self._data.close()
+        self._f.close()
+
+
+def replay(record: RoundRecord, env: Union[MahjongEnv, None] = None) -> MahjongEnv:
+    """
+    Rebuild the table of a recorded round by re-applying its actions to a freshly seeded table.
+    """
+    if env is None:
+        env = MahjongEnv()
+    recorder, env.recorder = getattr(env, "recorder", None), None
+    try:
+        env.reset(oya=record.oya, game_wind=record.game_wind, seed=record.seed)
+        for player_id, action, kan_tile in record.decoded_actions():
+            env.step(player_id, action, specified_tile=kan_tile)
+    finally:
+        env.recorder = recorder
+    return env
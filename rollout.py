@@ -0,0 +1,204 @@
+"""
+Monte Carlo evaluation of the candidate actions at a decision point of a `MahjongGameCore`.
+
+Each rollout restores a snapshot of the decision point in a worker process on a determinized table: the tiles
+the deciding player has not seen (the hands of the others and the wall) are dealt anew at random, and the public
+steps of the round are replayed on the new wall, so that the table looks the same to the player (see
+`MahjongEnv.redeal`). It then plays the candidate action and lets the agents of the config finish the round,
+taking a random valid action instead of their own with probability `epsilon`. The round payoff of the deciding
+player is averaged per action, and the estimates use nothing the player could not know. What the player knows
+is collected once per evaluation, so a rollout replays the round once, on its own wall. Rollouts are handed out
+a few at a time, so `evaluate` can stop at its time budget and return the estimates gathered so far.
+
+    python rollout.py -c config/default.yaml --decision 10 --budget 5
+"""
+import os
+import copy
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from gamecore import GameCoreSnapshot, MahjongGameCore
+
+# One game core per worker process, like the tournament workers.
+_worker_gc: Optional[MahjongGameCore] = None
+_worker_epsilon = 0.0
+
+
+def _init_worker(config: dict, epsilon: float):
+    global _worker_gc, _worker_epsilon
+    _worker_gc = MahjongGameCore(config)
+    _worker_epsilon = epsilon
+
+
+def _rollout(snapshot: GameCoreSnapshot, info, action: int, seed: int) -> Tuple[float, bool]:
+    gc = _worker_gc
+    rng = np.random.default_rng(seed)
+    redealt = gc.restore_redealt(snapshot, info, rng)
+    for agent in gc.agents:
+        agent.seed(int(rng.integers(2**63)))
+
+    gc.step(action)
+    while not gc.env.is_over():
+        a = None  # the agent of the seat decides
+        if rng.random() < _worker_epsilon:
+            a = int(rng.choice(gc.env.get_valid_actions()))
+        gc.step(a)
+    return float(gc.payoffs[info.player_id]), redealt
+
+
+def _portable(snapshot: GameCoreSnapshot) -> GameCoreSnapshot:
+    # a native table copy may not pickle, and the workers deal their own tables anyway
+    if snapshot.env.table is None:
+        return snapshot
+    snapshot = copy.copy(snapshot)
+    snapshot.env = copy.copy(snapshot.env)
+    snapshot.env.table = None
+    return snapshot
+
+
+class ActionStats(object):
+    __slots__ = ("n", "total", "total_sq", "n_redealt")
+
+    def __init__(self) -> None:
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.n_redealt = 0  # rollouts with the hands of the others dealt anew, not only the wall
+
+    def add(self, payoff: float, redealt: bool):
+        self.n += 1
+        self.total += payoff
+        self.total_sq += payoff * payoff
+        self.n_redealt += redealt
+
+    def summary(self) -> Dict[str, float]:
+        if self.n == 0:
+            return {"n": 0, "mean": None, "stderr": None, "redealt": None}
+        mean = self.total / self.n
+        var = max(self.total_sq / self.n - mean * mean, 0.0) * self.n / max(self.n - 1, 1)
+        return {
+            "n": self.n,
+            "mean": round(mean, 1),
+            "stderr": round(float(np.sqrt(var / self.n)), 1),
+            "redealt": round(self.n_redealt / self.n, 3),
+        }
+
+
+class RolloutEvaluator(object):
+    def __init__(
+        self,
+        config: dict,
+        n_workers: int = 0,
+        epsilon: float = 0.1,
+        seed=None,
+    ) -> None:
+        super().__init__()
+        config = dict(config, verbose=False, record=None, trajectory_dir=None)
+        if n_workers <= 0:
+            n_workers = os.cpu_count() or 1
+        self.n_workers = n_workers
+        self.rng = np.random.default_rng(seed)
+        self.executor = ProcessPoolExecutor(n_workers, initializer=_init_worker, initargs=(config, epsilon))
+
+    def evaluate(
+        self,
+        gc: MahjongGameCore,
+        n_rollouts: int = 256,
+        time_budget: Optional[float] = None,
+    ) -> Dict[int, Dict[str, float]]:
+        """
+        Expected round payoff of each valid action of the current decision of `gc`, from up to `n_rollouts`
+        rollouts per action, or as many as finish within `time_budget` seconds, and the share of the rollouts that
+        dealt the hands of the others anew rather than only the wall. `gc` is left untouched.
+        """
+        deadline = None if time_budget is None else time.perf_counter() + time_budget
+        player_id = gc.env.get_curr_player_id()
+        actions = [int(a) for a in gc.env.get_valid_actions()]
+        snapshot = _portable(gc.snapshot())
+        info = gc.env.information_set(player_id)
+        stats = {a: ActionStats() for a in actions}
+
+        # actions in turn, so every action has about as many rollouts whenever the budget runs out
+        tasks = ((actions[i % len(actions)], int(self.rng.integers(2**63))) for i in range(n_rollouts * len(actions)))
+        pending = {}
+
+        def submit_next():
+            task = next(tasks, None)
+            if task is not None:
+                future = self.executor.submit(_rollout, snapshot, info, *task)
+                pending[future] = task[0]
+
+        for _ in range(2 * self.n_workers):  # keep the workers busy without queueing the whole budget
+            submit_next()
+        while len(pending) > 0:
+            timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if len(done) == 0:  # out of time
+                break
+            for future in done:
+                stats[pending.pop(future)].add(*future.result())
+                submit_next()
+        for future in pending:
+            future.cancel()  # the ones already running finish in the background and are ignored
+        return {a: st.summary() for a, st in stats.items()}
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument("--decision", type=int, default=0, help="evaluate the n-th decision of player 0")
+    parser.add_argument("--rollouts", type=int, default=256, help="rollouts per action")
+    parser.add_argument("--budget", type=float, default=None, help="time budget (s)")
+    parser.add_argument("--epsilon", type=float, default=0.1, help="chance of a random action in rollouts")
+    parser.add_argument("--n_workers", "-j", type=int, default=0)
+    parser.add_argument("--seed", "-s", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    from utils import ACTION_TRANSLATION_TABLE
+
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    gc = MahjongGameCore(dict(config, verbose=False), seed=args.seed)
+    n_decisions = -1
+    while True:
+        if gc.is_terminated():
+            raise SystemExit("the hanchan ended before that decision")
+        if not gc.env.is_over() and gc.env.get_curr_player_id() == 0:
+            n_decisions += 1
+            if n_decisions == args.decision:
+                break
+        gc.step()
+
+    evaluator = RolloutEvaluator(config, args.n_workers, args.epsilon, seed=args.seed)
+    try:
+        t0 = time.perf_counter()
+        estimates = evaluator.evaluate(gc, args.rollouts, args.budget)
+    finally:
+        evaluator.close()
+    print(gc.get_player_info_str(0))
+    ranked = sorted(
+        estimates.items(), key=lambda item: -np.inf if item[1]["mean"] is None else item[1]["mean"], reverse=True
+    )
+    for a, st in ranked:
+        print(f"{ACTION_TRANSLATION_TABLE[a]:<8}{json.dumps(st)}")
+    print(f"{time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,333 @@
+"""
+Host many human-vs-AI tables in one process with asyncio.
+
+Each table is a coroutine around its own `MahjongGameCore`. Player 0 is a human reached through a channel
+(local socket, stdin/stdout, or a simulated client for load tests); the other seats are AI. Inference requests
+of all tables are batched per checkpoint and, like `env.step`, run on a bounded thread pool so the event loop
+only waits on humans.
+
+    python session_host.py -n 64 --humans simulated         # load test, prints a latency / throughput report
+    python session_host.py -n 64 --opponents ddqn bc ddqn   # the same against model seats
+    python session_host.py --humans stdio                   # play one table in the terminal
+    python session_host.py --humans socket --port 8765      # one table per connection, one JSON line per state
+"""
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+
+import numpy as np
+import yaml
+from pymahjong import MahjongEnv
+
+from agent import MajAgent, parse_agent_spec
+from gamecore import MahjongGameCore, agent_checkpoint
+from record import writer_path
+from utils import ACTION_TRANSLATION_TABLE, spawn_seeds
+
+
+class AsyncBatcher(object):
+    """
+    Collects the decisions of one checkpoint from all tables and answers them with one `select_actions` call,
+    issued when `max_batch` are pending or `max_wait` seconds after the first one.
+    """
+
+    def __init__(self, agent: MajAgent, executor, max_batch: int = 64, max_wait: float = 0.002) -> None:
+        super().__init__()
+        self.agent = agent
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[np.ndarray, np.ndarray, asyncio.Future]] = []
+        self._flush_handle = None
+        self.batch_sizes: List[int] = []
+
+    async def select(self, obs: np.ndarray, mask: np.ndarray) -> int:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((obs, mask, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if len(batch) == 0:
+            return
+        self.batch_sizes.append(len(batch))
+        task = asyncio.get_running_loop().run_in_executor(
+            self.executor,
+            self.agent.select_actions,
+            np.stack([item[0] for item in batch]),
+            np.stack([item[1] for item in batch]),
+        )
+
+        def distribute(task):
+            if task.exception() is not None:
+                for item in batch:
+                    item[2].set_exception(task.exception())
+                return
+            for item, action in zip(batch, task.result()):
+                item[2].set_result(int(action))
+
+        task.add_done_callback(distribute)
+
+
+def render_table_text(gc: MahjongGameCore) -> str:
+    return "\n".join(
+        [gc.get_dora_info_str()] + [gc.get_player_info_str(i) for i in (2, 3, 1, 0)]
+    )
+
+
+class SimulatedHuman(object):
+    """
+    A client choosing a random valid action after `think_time` seconds, for load tests.
+    """
+
+    def __init__(self, seed=None, think_time: float = 0.0) -> None:
+        super().__init__()
+        self.rng = np.random.default_rng(seed)
+        self.think_time = think_time
+
+    async def request_action(self, gc: MahjongGameCore, valid_actions: np.ndarray) -> int:
+        if self.think_time > 0:
+            await asyncio.sleep(self.think_time)
+        if MahjongEnv.PASS_RESPONSE in valid_actions:
+            valid_actions = valid_actions[:-1]
+        return int(self.rng.choice(valid_actions))
+
+    async def close(self):
+        pass
+
+
+class StreamHuman(object):
+    """
+    A client on a pair of asyncio streams: each decision sends one JSON line with the table text and the valid
+    actions, and reads back one line holding the chosen action index.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer, json_lines: bool = True) -> None:
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+        self.json_lines = json_lines
+
+    def _send(self, text: str, valid_actions: np.ndarray):
+        if self.json_lines:
+            msg = json.dumps(
+                {"state": text, "valid_actions": [int(a) for a in valid_actions]},
+                ensure_ascii=False,
+            )
+        else:
+            choices = " ".join(f"{a}:{ACTION_TRANSLATION_TABLE[a]}" for a in valid_actions)
+            msg = f"{text}\n{choices}\n> "
+        self.writer.write((msg + ("\n" if self.json_lines else "")).encode("utf-8"))
+
+    async def request_action(self, gc: MahjongGameCore, valid_actions: np.ndarray) -> int:
+        text = render_table_text(gc)
+        while True:
+            self._send(text, valid_actions)
+            await self.writer.drain()
+            line = await self.reader.readline()
+            if not line:
+                raise ConnectionError("the client has left")
+            try:
+                action = int(line.decode("utf-8").strip())
+            except ValueError:
+                continue
+            if action in valid_actions:
+                return action
+
+    async def close(self):
+        self.writer.close()
+
+
+class _StdoutWriter(object):
+    # the subset of asyncio.StreamWriter used by StreamHuman
+    def write(self, data: bytes):
+        sys.stdout.write(data.decode("utf-8"))
+        sys.stdout.flush()
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+async def stdio_human() -> StreamHuman:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+    return StreamHuman(reader, _StdoutWriter(), json_lines=False)
+
+
+class SessionHost(object):
+    def __init__(
+        self,
+        config: dict,
+        max_workers: int = 4,
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        seed=None,
+    ) -> None:
+        super().__init__()
+        # the host chooses every action, so the game cores need no models of their own
+        self.config = dict(config, player="random", opponents=["random"] * 3, verbose=False)
+        self.seat_types = list(config["opponents"])
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        agent_seed, self.table_seeds, self.human_seeds = spawn_seeds(seed, 3)
+        self.n_tables = 0
+
+        self.batchers: Dict[str, AsyncBatcher] = {}
+        self.random_agent = MajAgent("random", seed=agent_seed)
+        for spec in set(self.seat_types) - {"random"}:
+            type, backend = parse_agent_spec(spec)
+            self.batchers[spec] = AsyncBatcher(
+                MajAgent(type, agent_checkpoint(type), backend=backend), self.executor, max_batch, max_wait
+            )
+            self.batchers[spec].agent.load()  # not on the first decision, which would skew the latencies
+
+        self.decision_latencies: List[float] = []  # s, AI decisions
+        self.n_steps = 0
+        self.n_hanchans = 0
+
+    async def _ai_action(self, gc: MahjongGameCore, player_id: int) -> int:
+        type = self.seat_types[player_id - 1]
+        t0 = time.perf_counter()
+        if type == "random":
+            action = int(self.random_agent.select_action(None, gc.env.get_valid_actions()))
+        else:
+            # the same mean-latent policy as `MajAgent.select_action` of the seat, one batch for all tables
+            action = await self.batchers[type].select(
+                gc.env.get_obs(player_id), gc.env.get_valid_actions(nhot=True)
+            )
+        self.decision_latencies.append(time.perf_counter() - t0)
+        return action
+
+    async def play_table(self, human, n_hanchans: int = 1):
+        loop = asyncio.get_running_loop()
+        table_seed = spawn_seeds(self.table_seeds, self.n_tables + 1)[-1]
+        config = self.config
+        # one record file per table; the trajectory writers of the tables choose distinct prefixes themselves
+        if config.get("record"):
+            config = dict(config, record=writer_path(config["record"], f"table{self.n_tables}"))
+        self.n_tables += 1
+        gc = await loop.run_in_executor(self.executor, MahjongGameCore, config, table_seed)
+        try:
+            for hanchan in range(n_hanchans):
+                if hanchan > 0:
+                    gc.restart()
+                while not gc.is_terminated():
+                    if gc.env.is_over():
+                        action = None  # next round
+                    else:
+                        player_id = gc.env.get_curr_player_id()
+                        if player_id == 0:
+                            action = await human.request_action(gc, gc.env.get_valid_actions())
+                        else:
+                            action = await self._ai_action(gc, player_id)
+                    await loop.run_in_executor(self.executor, gc.step, action)
+                    self.n_steps += 1
+                gc.calc_final_scores()
+                self.n_hanchans += 1
+        finally:
+            await human.close()
+            gc.close()
+
+    def report(self, wall_time: float, cpu_time: float) -> dict:
+        latencies = np.array(self.decision_latencies) * 1e3
+        cpu_util = cpu_time / max(wall_time, 1e-9)  # cores kept busy
+        return {
+            "n_tables": self.n_tables,
+            "n_hanchans": self.n_hanchans,
+            "steps_per_sec": round(self.n_steps / max(wall_time, 1e-9), 1),
+            "cpu_util": round(cpu_util, 2),
+            "tables_per_core": round(self.n_tables / max(cpu_util, 1e-9), 1),
+            "decision_p50_ms": round(float(np.percentile(latencies, 50)), 3) if len(latencies) else None,
+            "decision_p99_ms": round(float(np.percentile(latencies, 99)), 3) if len(latencies) else None,
+            "mean_batch_size": {
+                type: round(float(np.mean(b.batch_sizes)), 2) if b.batch_sizes else None
+                for type, b in self.batchers.items()
+            },
+        }
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def serve_simulated(host: SessionHost, n_tables: int, n_hanchans: int, think_time: float) -> dict:
+    t0, c0 = time.perf_counter(), time.process_time()
+    seeds = spawn_seeds(host.human_seeds, n_tables)
+    await asyncio.gather(
+        *[host.play_table(SimulatedHuman(seeds[i], think_time), n_hanchans) for i in range(n_tables)]
+    )
+    return host.report(time.perf_counter() - t0, time.process_time() - c0)
+
+
+async def serve_socket(host: SessionHost, port: int):
+    async def on_connect(reader, writer):
+        await host.play_table(StreamHuman(reader, writer))
+
+    server = await asyncio.start_server(on_connect, "127.0.0.1", port)
+    async with server:
+        await server.serve_forever()
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument(
+        "--humans", choices=["simulated", "stdio", "socket"], default="simulated"
+    )
+    parser.add_argument("--n_tables", "-n", type=int, default=16, help="simulated tables")
+    parser.add_argument("--n_hanchans", type=int, default=1, help="hanchans per simulated table")
+    parser.add_argument("--think_time", type=float, default=0.0, help="simulated human delay (s)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=4, help="threads for inference and env.step")
+    parser.add_argument("--max_batch", type=int, default=64)
+    parser.add_argument("--max_wait", type=float, default=0.002, help="batching window (s)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--opponents", type=str, nargs=3, default=None, help="AI seats 1-3, overriding the config"
+    )
+    return parser.parse_args()
+
+
+async def main(args, config):
+    host = SessionHost(
+        config, args.workers, args.max_batch, args.max_wait, seed=args.seed
+    )
+    try:
+        if args.humans == "simulated":
+            print(json.dumps(await serve_simulated(host, args.n_tables, args.n_hanchans, args.think_time)))
+        elif args.humans == "stdio":
+            await host.play_table(await stdio_human())
+        else:
+            await serve_socket(host, args.port)
+    finally:
+        host.close()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    if args.opponents is not None:
+        config["opponents"] = args.opponents
+    asyncio.run(main(args, config))
@@ -0,0 +1,206 @@
+"""
+Shanten, tenpai and waits of hands given as 34-tile count vectors (index order of `utils.TILE_LIST`).
+
+Each suit is looked up in a table indexed by its base-5 count code. A row holds, for m = 0..4 melds with and
+without a pair, how many tiles the suit lacks to contain them. The rows of the four suits are merged by a
+min-plus convolution, so any batch of hands is evaluated with a fixed number of NumPy operations:
+
+    shanten(counts)            # (..., 34) -> (...)
+    discard_shanten(counts)    # 3n+2 tiles: shanten after each discard, (..., 34)
+    waits(counts)              # 3n+1 tiles: tiles completing the hand, (..., 34)
+    ukeire(counts, unseen)     # 3n+2 tiles: shanten and number of effective tiles of each discard
+
+Seven pairs and thirteen orphans are taken into account for closed hands. The tables are built on first use.
+"""
+import re
+import itertools
+import threading
+from typing import List
+
+import numpy as np
+
+from utils import notation_to_idx
+
+N_TILE_TYPES = 34
+MAX_MELDS = 4
+N_COLUMNS = 2 * (MAX_MELDS + 1)  # column m + 5 * p: m melds, and a pair if p
+MAX_SUIT_TILES = 14
+INVALID = 99  # discarding a tile not in hand, or drawing a tile of which the hand holds all 4
+TILE_NOTATION = re.compile(r"[0-9][mpsz]")
+
+SUIT_POWERS = 5 ** np.arange(9)
+HONOR_POWERS = 5 ** np.arange(7)
+TERMINALS_AND_HONORS = np.array([0, 8, 9, 17, 18, 26] + list(range(27, 34)))
+TARGET_SIZES = np.array([3 * m + 2 * p for p in (0, 1) for m in range(MAX_MELDS + 1)], dtype=np.int8)
+
+
+def _column(m: int, p: int) -> int:
+    return m + (MAX_MELDS + 1) * p
+
+
+def _build_table(n_ranks: int, sequences: bool) -> np.ndarray:
+    """
+    (5^n_ranks, N_COLUMNS) tiles lacking in each suit hand of at most MAX_SUIT_TILES tiles.
+    """
+    powers = 5 ** np.arange(n_ranks)
+    n_codes = 5**n_ranks
+    codes = np.arange(n_codes, dtype=np.int32)
+    digits = np.empty((n_codes, n_ranks), dtype=np.int8)
+    for i in range(n_ranks):
+        digits[:, i] = (codes // powers[i]) % 5
+    levels = digits.sum(axis=1, dtype=np.int32)
+    by_level = [np.flatnonzero(levels == level) for level in range(MAX_SUIT_TILES + 1)]
+
+    # the targets: m melds (triplets, and runs in the number suits) and an optional pair, at most 4 of a tile
+    melds = [3 * np.eye(n_ranks, dtype=np.int32)[i] for i in range(n_ranks)]
+    if sequences:
+        melds += [np.eye(n_ranks, dtype=np.int32)[i : i + 3].sum(axis=0) for i in range(n_ranks - 2)]
+    melds = np.array(melds)
+    pairs = 2 * np.eye(n_ranks, dtype=np.int32)
+
+    # bit c of in_closure[h]: h is part of some target of column c
+    in_closure = np.zeros(n_codes, dtype=np.uint16)
+    for m in range(MAX_MELDS + 1):
+        combos = np.array(list(itertools.combinations_with_replacement(range(len(melds)), m)), dtype=np.int64)
+        meld_sums = melds[combos].sum(axis=1) if m > 0 else np.zeros((1, n_ranks), dtype=np.int32)
+        for p in (0, 1):
+            targets = meld_sums if p == 0 else (meld_sums[:, None, :] + pairs[None]).reshape(-1, n_ranks)
+            targets = targets[(targets <= 4).all(axis=1)]
+            in_closure[targets @ powers] |= 1 << _column(m, p)
+    for level in range(MAX_SUIT_TILES - 1, -1, -1):
+        idx = by_level[level]
+        for i in range(n_ranks):
+            sub = idx[digits[idx, i] < 4]
+            in_closure[sub] |= in_closure[sub + powers[i]]
+
+    # overlap[h, c]: the most tiles of h that are part of one target of column c
+    bits = (1 << np.arange(N_COLUMNS)).astype(np.uint16)
+    overlap = np.zeros((n_codes, N_COLUMNS), dtype=np.int8)
+    for level in range(1, MAX_SUIT_TILES + 1):
+        idx = by_level[level]
+        best = np.zeros((len(idx), N_COLUMNS), dtype=np.int8)
+        for i in range(n_ranks):
+            has = digits[idx, i] > 0
+            best[has] = np.maximum(best[has], overlap[idx[has] - powers[i]])
+        member = (in_closure[idx, None] & bits) != 0
+        overlap[idx] = np.where(member, level, best)
+    return TARGET_SIZES - overlap
+
+
+_tables = None
+_tables_lock = threading.Lock()
+
+
+def get_tables():
+    """
+    (number suit table, honor table), built once per process.
+    """
+    global _tables
+    with _tables_lock:
+        if _tables is None:
+            _tables = (_build_table(9, sequences=True), _build_table(7, sequences=False))
+        return _tables
+
+
+def _combine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # min-plus convolution over the melds, with the pair in at most one of the two parts
+    k = MAX_MELDS + 1
+    out = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=np.int16)
+    for m in range(k):
+        out[..., m] = np.min(np.stack([a[..., i] + b[..., m - i] for i in range(m + 1)]), axis=0)
+        out[..., k + m] = np.min(
+            np.stack(
+                [a[..., k + i] + b[..., m - i] for i in range(m + 1)]
+                + [a[..., i] + b[..., k + m - i] for i in range(m + 1)]
+            ),
+            axis=0,
+        )
+    return out
+
+
+def _regular_shanten(counts: np.ndarray) -> np.ndarray:
+    suit_table, honor_table = get_tables()
+    lacking = None
+    for start in (0, 9, 18):
+        part = suit_table[counts[..., start : start + 9] @ SUIT_POWERS].astype(np.int16)
+        lacking = part if lacking is None else _combine(lacking, part)
+    lacking = _combine(lacking, honor_table[counts[..., 27:] @ HONOR_POWERS].astype(np.int16))
+    # a hand of 3n+1 or 3n+2 tiles is complete with n melds and a pair (melds called before are not in counts)
+    n_melds = np.minimum(counts.sum(axis=-1) // 3, MAX_MELDS)
+    return np.take_along_axis(lacking, (_column(0, 1) + n_melds)[..., None], axis=-1)[..., 0] - 1
+
+
+def shanten(counts) -> np.ndarray:
+    """
+    Shanten of (..., 34) hands, -1 for a complete hand.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    ret = _regular_shanten(counts)
+
+    closed = counts.sum(axis=-1) >= 13
+    if closed.any():
+        pairs = (counts >= 2).sum(axis=-1)
+        kinds = (counts >= 1).sum(axis=-1)
+        seven_pairs = 6 - pairs + np.maximum(0, 7 - kinds)
+        orphans = counts[..., TERMINALS_AND_HONORS]
+        thirteen_orphans = 13 - (orphans >= 1).sum(axis=-1) - (orphans >= 2).any(axis=-1)
+        ret = np.where(closed, np.minimum(ret, np.minimum(seven_pairs, thirteen_orphans)), ret)
+    return ret
+
+
+def discard_shanten(counts) -> np.ndarray:
+    """
+    Shanten after discarding each tile type from (..., 34) hands of 3n+2 tiles, INVALID for tiles not in hand.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    after = counts[..., None, :] - np.eye(N_TILE_TYPES, dtype=np.int64)
+    ret = shanten(np.maximum(after, 0))
+    return np.where(counts > 0, ret, INVALID)
+
+
+def draw_shanten(counts) -> np.ndarray:
+    """
+    Shanten after drawing each tile type into (..., 34) hands of 3n+1 tiles, INVALID for tiles held 4 times.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    after = counts[..., None, :] + np.eye(N_TILE_TYPES, dtype=np.int64)
+    ret = shanten(np.minimum(after, 4))
+    return np.where(counts < 4, ret, INVALID)
+
+
+def waits(counts) -> np.ndarray:
+    """
+    (..., 34) mask of the tiles completing hands of 3n+1 tiles. A tile the hand holds all 4 of is no wait.
+    """
+    return draw_shanten(counts) == -1
+
+
+def is_tenpai(counts) -> np.ndarray:
+    return waits(counts).any(axis=-1)
+
+
+def ukeire(counts, unseen):
+    """
+    For (..., 34) hands of 3n+2 tiles and the (..., 34) number of unseen copies of each tile, per discard:
+    the shanten after it (INVALID for tiles not in hand) and how many unseen tiles would lower that shanten.
+    All 34 discards and their 34 draws are evaluated in one batch.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    eye = np.eye(N_TILE_TYPES, dtype=np.int64)
+    after_discard = np.maximum(counts[..., None, :] - eye, 0)  # (..., discard, 34)
+    base = shanten(after_discard)
+    after_draw = np.minimum(after_discard[..., :, None, :] + eye, 4)  # (..., discard, draw, 34)
+    effective = shanten(after_draw) < base[..., None]
+    n_effective = (effective * np.asarray(unseen)[..., None, :]).sum(axis=-1)
+    in_hand = counts > 0
+    return np.where(in_hand, base, INVALID), np.where(in_hand, n_effective, 0)
+
+
+def hand_to_counts(tiles: List[str]) -> np.ndarray:
+    """
+    ["1m", "0p", "7z", ...] -> (34,) counts, red fives counted as fives.
+    """
+    counts = np.zeros(N_TILE_TYPES, dtype=np.int64)
+    for tile in tiles:
+        counts[notation_to_idx(tile)] += 1
+    return counts
@@ -0,0 +1,161 @@
+"""
+Compare a checkpoint against a baseline with a sequential probability ratio test on the mean pt.
+
+The candidate plays player 0 against three copies of the baseline (the oya is drawn per hanchan, so one seat is as
+good as another). Hanchans are played in parallel like a tournament but reach the test in hanchan order, as
+short hanchans finish first and have more extreme pt, which would bias the sample the test stops on. After
+each result, the test asks:
+
+    H0: the mean pt of the candidate is `pt0` (default 0, no better than the baseline)
+    H1: the mean pt of the candidate is `pt1`
+
+with error rates `alpha` (accepting H1 when H0 holds) and `beta` (accepting H0 when H1 holds). The pt of a
+hanchan is that of `calc_final_scores`, i.e. including `BONUS_POINTS`. The test stops as soon as either
+hypothesis is accepted, usually long before a fixed budget would, or after `max_hanchans`.
+
+    python sprt.py --candidate chkpt/new.pth --baseline ddqn -j 8
+"""
+import json
+import math
+from typing import Dict, Optional
+
+import numpy as np
+import yaml
+
+from tournament import run_tournament
+
+Z_95 = 1.959964
+
+
+class SPRT(object):
+    """
+    Sequential test of the mean of a normal variable, its variance estimated from the samples so far.
+    """
+
+    def __init__(
+        self,
+        pt0: float = 0.0,
+        pt1: float = 5.0,
+        alpha: float = 0.05,
+        beta: float = 0.05,
+        min_samples: int = 32,
+    ) -> None:
+        super().__init__()
+        self.pt0 = pt0
+        self.pt1 = pt1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self.min_samples = min_samples
+        # running mean and sum of squared deviations (Welford)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    @property
+    def var(self) -> float:
+        return self.m2 / (self.n - 1) if self.n > 1 else math.inf
+
+    @property
+    def llr(self) -> float:
+        # log likelihood ratio of H1 to H0
+        if self.n < 2 or self.var == 0:
+            return 0.0
+        return self.n * ((self.mean - self.pt0) ** 2 - (self.mean - self.pt1) ** 2) / (2 * self.var)
+
+    def status(self) -> Optional[str]:
+        """
+        "H1", "H0", or None while undecided.
+        """
+        if self.n < self.min_samples:
+            return None
+        llr = self.llr
+        if llr >= self.upper:
+            return "H1"
+        if llr <= self.lower:
+            return "H0"
+        return None
+
+    def confidence_interval(self, z: float = Z_95):
+        half = z * math.sqrt(self.var / self.n) if self.n > 1 else math.inf
+        return self.mean - half, self.mean + half
+
+    def summary(self) -> Dict[str, float]:
+        low, high = self.confidence_interval()
+        return {
+            "n_hanchans": self.n,
+            "mean_pt": round(self.mean, 2),
+            "ci95": [round(low, 2), round(high, 2)],
+            "llr": round(self.llr, 3),
+            "bounds": [round(self.lower, 3), round(self.upper, 3)],
+            "status": self.status(),
+        }
+
+
+def run_sprt(
+    config: dict,
+    candidate: str,
+    baseline: str,
+    test: SPRT,
+    max_hanchans: int = 10000,
+    n_workers: int = 0,
+    seed=None,
+    verbose: bool = True,
+) -> SPRT:
+    """
+    Play hanchans of `candidate` (player 0) against three `baseline` until `test` is decided.
+    Agent entries are the same as in the config: "ddqn", "bc", a .pth path, optionally with ":backend".
+    """
+    config = dict(config, player=candidate, opponents=[baseline] * 3)
+    results = run_tournament(config, max_hanchans, n_workers, seed, ordered=True)
+    try:
+        for result in results:
+            test.add(result["pt"][result["ranks"].index(0)])
+            if verbose:
+                print(json.dumps(test.summary()))
+            if test.status() is not None:
+                break
+    finally:
+        results.close()  # stops the pool without playing the rest of the budget
+    return test
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument("--candidate", type=str, required=True, help="agent entry or .pth of the new agent")
+    parser.add_argument("--baseline", type=str, default="ddqn", help="agent entry or .pth to compare against")
+    parser.add_argument("--pt0", type=float, default=0.0, help="mean pt of the candidate under H0")
+    parser.add_argument("--pt1", type=float, default=5.0, help="mean pt of the candidate under H1")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    parser.add_argument("--max_hanchans", "-n", type=int, default=10000)
+    parser.add_argument("--n_workers", "-j", type=int, default=0, help="number of processes")
+    parser.add_argument("--seed", "-s", type=int, default=None)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    seed = np.random.SeedSequence(args.seed if args.seed is not None else config.get("seed"))
+    test = SPRT(args.pt0, args.pt1, args.alpha, args.beta)
+    run_sprt(config, args.candidate, args.baseline, test, args.max_hanchans, args.n_workers, seed)
+    summary = test.summary()
+    summary["seed"] = seed.entropy  # rerun with -s to reproduce
+    print(json.dumps(summary))
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("MahjongPyWrapper")
+
+from env_pymahjong import SEEDED_TABLES, MahjongEnv
+from record import GameRecord, GameRecorder, replay
+
+KANS = (MahjongEnv.ANKAN, MahjongEnv.KAKAN, MahjongEnv.MINKAN)
+
+
+def test_kan_tiles_are_packed_with_the_player(tmp_path):
+    path = str(tmp_path / "games.rec")
+    recorder = GameRecorder(path)
+    recorder.begin_round(123456789, 2, "south")
+    steps = [
+        (0, 5, None),
+        (2, MahjongEnv.ANKAN, 33),  # the largest tile id, 34 << 2 still fits the byte
+        (3, MahjongEnv.KAKAN, 0),
+        (1, MahjongEnv.MINKAN, None),  # the tile of a Min-Kan is not recorded
+        (1, MahjongEnv.PASS_RESPONSE, None),
+    ]
+    for step in steps:
+        recorder.record(*step)
+    recorder.close()
+
+    record = GameRecord(path)
+    assert len(record) == 1
+    round_record = record[0]
+    assert (round_record.seed, round_record.oya, round_record.game_wind) == (123456789, 2, "south")
+    assert list(round_record.decoded_actions()) == steps
+    assert round_record.actions[1].tolist() == [2 | 34 << 2, MahjongEnv.ANKAN]
+    assert round_record.actions[2].tolist() == [3 | 1 << 2, MahjongEnv.KAKAN]
+    record.close()  # while `round_record` is alive
+    assert list(round_record.decoded_actions()) == steps
+
+
+def play_round(env: MahjongEnv, rng: np.random.Generator):
+    # random, but any kan whenever one is offered
+    while not env.is_over():
+        valid_actions = env.get_valid_actions()
+        kans = [action for action in valid_actions if action in KANS]
+        env.step(env.get_curr_player_id(), int(rng.choice(kans if kans else valid_actions)))
+
+
+@pytest.mark.skipif(not SEEDED_TABLES, reason="this pymahjong build cannot seed its tables")
+def test_recorded_rounds_replay(tmp_path):
+    path = str(tmp_path / "games.rec")
+    env = MahjongEnv()
+    env.recorder = GameRecorder(path)
+    rng = np.random.default_rng(0)
+    played = []
+    for seed in range(6):
+        env.reset(oya=seed % 4, game_wind=["east", "south"][seed % 2], seed=seed)
+        play_round(env, rng)
+        played.append((seed, list(env._actions), env._fingerprint()))
+    env.recorder.close()
+    env.recorder = None
+
+    record = GameRecord(path)
+    assert len(record) == len(played)
+    for i, (seed, actions, fingerprint) in enumerate(played):
+        round_record = record[i]
+        assert round_record.seed == seed
+        assert list(round_record.decoded_actions()) == [
+            (player_id, action, None if kan_tile is None else int(kan_tile))
+            for player_id, action, kan_tile in actions
+        ]
+        replayed = replay(round_record, MahjongEnv())
+        assert replayed.is_over()
+        assert replayed._fingerprint() == fingerprint
+    record.close()
@@ -0,0 +1,133 @@
+import itertools
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pymahjong")  # shanten itself only needs NumPy, but reads the tile notation from utils
+
+from shanten import (
+    INVALID,
+    discard_shanten,
+    hand_to_counts,
+    is_tenpai,
+    shanten,
+    ukeire,
+    waits,
+)
+from utils import notation_to_idx
+
+
+def hand(notation: str) -> np.ndarray:
+    # "123m456p11z" -> (34,) counts
+    tiles, digits = [], ""
+    for ch in notation:
+        if ch.isdigit():
+            digits += ch
+        else:
+            tiles += [digit + ch for digit in digits]
+            digits = ""
+    return hand_to_counts(tiles)
+
+
+def mask(notation: str) -> np.ndarray:
+    return hand(notation) > 0
+
+
+@pytest.mark.parametrize(
+    "notation, expected",
+    [
+        ("123m456p789s11122z", -1),
+        ("123m456p789s11123z", 0),
+        ("123m456p789s1123z", 1),  # 13 tiles: 3 melds, a pair and two singles
+        ("1122m3355p6677s11z", -1),  # seven pairs
+        ("1122m3355p6677s1z", 0),
+        ("19m19p19s12345677z", -1),  # thirteen orphans
+        ("19m19p19s1234567z", 0),
+        ("19m19p19s1234566z", 0),
+        ("147m258p369s1234z", 6),
+        ("11z", -1),  # after four calls
+        ("1z", 0),
+    ],
+)
+def test_known_shanten(notation, expected):
+    assert shanten(hand(notation)) == expected
+
+
+@pytest.mark.parametrize(
+    "notation, expected_waits",
+    [
+        ("123m456p789s111z2z", "2z"),
+        ("1112m234p567s789s", "23m"),
+        ("1112345678999m", "123456789m"),  # nine gates
+        ("1122m3355p6677s1z", "1z"),
+        ("19m19p19s1234567z", "19m19p19s1234567z"),  # thirteen-sided
+        ("19m19p19s1234566z", "7z"),
+        ("123m456p789s1123z", ""),
+    ],
+)
+def test_known_waits(notation, expected_waits):
+    np.testing.assert_array_equal(waits(hand(notation)), mask(expected_waits))
+    assert is_tenpai(hand(notation)) == bool(expected_waits)
+
+
+def test_a_tile_held_four_times_is_no_wait():
+    # the single 1m of 1111m would wait on a fifth one
+    assert not is_tenpai(hand("1111m123s456p789s"))
+    # but the fourth 1m completes 111m + 123m
+    np.testing.assert_array_equal(waits(hand("111m23m456p789s11z")), mask("14m1z"))
+
+
+def test_discards_of_a_14_tile_hand():
+    counts = hand("123m456p789s111z25z")
+    after = discard_shanten(counts)
+    assert after[notation_to_idx("5z")] == 0
+    assert after[notation_to_idx("2z")] == 0
+    assert after[notation_to_idx("1z")] == 1
+    assert (after[counts == 0] == INVALID).all()
+
+    base, n_effective = ukeire(counts, 4 - counts)
+    np.testing.assert_array_equal(base, after)
+    assert n_effective[notation_to_idx("5z")] == 3  # the other 2z
+    assert n_effective[notation_to_idx("2z")] == 3  # the other 5z
+    assert (n_effective[counts == 0] == 0).all()
+
+
+def test_batched_hands_match_one_by_one():
+    rng = np.random.default_rng(0)
+    hands = np.stack([random_hand(rng, 14) for _ in range(16)])
+    expected = np.array([discard_shanten(counts) for counts in hands])
+    np.testing.assert_array_equal(discard_shanten(hands), expected)
+    assert shanten(hands.reshape(4, 4, 34)).shape == (4, 4)
+
+
+def random_hand(rng: np.random.Generator, n_tiles: int, tile_types=np.arange(34)) -> np.ndarray:
+    wall = np.repeat(tile_types, 4)
+    return np.bincount(rng.choice(wall, n_tiles, replace=False), minlength=34)
+
+
+def complete_hands(n_melds: int) -> np.ndarray:
+    # every hand of n_melds melds and a pair, at most 4 of a tile
+    eye = np.eye(34, dtype=np.int64)
+    melds = [3 * eye[i] for i in range(34)]
+    melds += [eye[s + i : s + i + 3].sum(axis=0) for s in (0, 9, 18) for i in range(7)]
+    hands = []
+    for combo in itertools.combinations_with_replacement(melds, n_melds):
+        for pair in range(34):
+            counts = sum(combo, 2 * eye[pair])
+            if counts.max() <= 4:
+                hands.append(counts)
+    return np.unique(np.array(hands), axis=0)
+
+
+@pytest.mark.parametrize("n_melds", [0, 1, 2])
+def test_brute_force(n_melds):
+    # the shanten of a hand is one less than the fewest tiles it lacks to be any complete hand of its size
+    complete = complete_hands(n_melds)
+    rng = np.random.default_rng(n_melds)
+    for n_tiles in (3 * n_melds + 1, 3 * n_melds + 2):
+        for _ in range(50):
+            # few neighbouring tile types, so that the hands are close to complete ones
+            tile_types = rng.integers(34 - 6) + np.arange(6)
+            counts = random_hand(rng, n_tiles, tile_types)
+            lacking = np.maximum(complete - counts, 0).sum(axis=1).min()
+            assert shanten(counts) == lacking - 1, counts
@@ -0,0 +1,88 @@
+import copy
+
+import numpy as np
+import pytest
+
+pytest.importorskip("MahjongPyWrapper")
+
+from env_pymahjong import SEEDED_TABLES, MahjongEnv, ReplayDivergedError
+
+# replays deal the walls of the seeds, see the README for the builds of pymahjong this repo works with
+pytestmark = pytest.mark.skipif(not SEEDED_TABLES, reason="this pymahjong build cannot seed its tables")
+
+
+def play(env: MahjongEnv, rng: np.random.Generator, n_steps: int):
+    for _ in range(n_steps):
+        if env.is_over():
+            return
+        player_id = env.get_curr_player_id()
+        env.step(player_id, int(rng.choice(env.get_valid_actions())))
+
+
+def state(env: MahjongEnv):
+    player_id = env.get_curr_player_id()
+    return player_id, env.get_full_obs(player_id), env.get_valid_actions(nhot=True)
+
+
+def replay_only(snapshot):
+    # drop the native table copy, so that restoring replays the steps
+    snapshot = copy.copy(snapshot)
+    snapshot.table = None
+    return snapshot
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_restore_after_playing_on(seed):
+    env = MahjongEnv()
+    env.reset(oya=0, game_wind="east", seed=seed)
+    rng = np.random.default_rng(seed)
+    play(env, rng, 20)
+    snapshot = env.snapshot()
+    expected = state(env)
+
+    play(env, rng, 40)
+    env.restore(snapshot)
+    player_id, full_obs, valid_actions = state(env)
+    assert player_id == expected[0]
+    np.testing.assert_array_equal(full_obs, expected[1])
+    np.testing.assert_array_equal(valid_actions, expected[2])
+
+    # replaying from the start of the round, in a fresh env
+    other = MahjongEnv()
+    other.restore(replay_only(snapshot))
+    player_id, full_obs, valid_actions = state(other)
+    assert player_id == expected[0]
+    np.testing.assert_array_equal(full_obs, expected[1])
+    np.testing.assert_array_equal(valid_actions, expected[2])
+
+
+def test_restore_raises_when_the_replay_diverges():
+    env = MahjongEnv()
+    env.reset(oya=0, game_wind="east", seed=1)
+    snapshot = replay_only(env.snapshot())
+    seed, oya, game_wind, debug_mode, yama = snapshot.round
+    snapshot.round = (seed + 1, oya, game_wind, debug_mode, yama)  # another wall than the one fingerprinted
+    with pytest.raises(ReplayDivergedError):
+        MahjongEnv().restore(snapshot)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_redeal_keeps_what_the_player_has_seen(seed):
+    env = MahjongEnv()
+    env.reset(oya=0, game_wind="east", seed=seed)
+    rng = np.random.default_rng(seed)
+    play(env, rng, 20)
+    player_id = env.get_curr_player_id()
+    info = env.information_set(player_id)
+    hands = [sorted(tile.id for tile in env.t.players[i].hand) for i in range(4)]
+
+    other = MahjongEnv()
+    n_changed = 0
+    for _ in range(8):
+        other.redeal(info, rng)
+        assert other.get_curr_player_id() == player_id
+        np.testing.assert_array_equal(other.get_obs(player_id), info.obs)
+        new_hands = [sorted(tile.id for tile in other.t.players[i].hand) for i in range(4)]
+        assert new_hands[player_id] == hands[player_id]
+        n_changed += new_hands != hands
+    assert n_changed > 0
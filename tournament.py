@@ -0,0 +1,244 @@
+import os
+import json
+import multiprocessing as mp
+from multiprocessing.util import Finalize
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+import yaml
+
+from gamecore import MahjongGameCore, preload_agents
+from record import writer_path
+from utils import spawn_seeds
+
+# One game core per worker process, so the agents are loaded once and reused by every hanchan.
+_worker_gc: Optional[MahjongGameCore] = None
+
+
+def _init_worker(config: dict, pooled: bool = False):
+    global _worker_gc
+    if pooled and config.get("record"):
+        config = dict(config, record=writer_path(config["record"], os.getpid()))
+    _worker_gc = MahjongGameCore(config)
+    # flush records and trajectories when the pool shuts the worker down
+    Finalize(_worker_gc, _worker_gc.close, exitpriority=16)
+
+
+def play_hanchan(
+    gc: MahjongGameCore,
+    seed: Optional[np.random.SeedSequence] = None,
+    oya: Optional[int] = None,
+) -> Dict[str, list]:
+    """
+    Play one full hanchan without any human input or animation.
+    """
+    gc.restart(seed, oya)
+    while not gc.is_terminated():
+        gc.step()
+    displayed_scores, displayed_sequence = gc.calc_final_scores()
+    return {
+        "ranks": [int(idx) for idx in displayed_sequence],
+        "pt": [float(score) for score in displayed_scores],
+        "cumulative_scores": [int(sc) for sc in gc.game_status["cumulative_scores"]],
+    }
+
+
+def play_duplicate(
+    gc: MahjongGameCore, seed: Optional[np.random.SeedSequence] = None
+) -> Dict[str, list]:
+    """
+    Play the walls of `seed` four times, the agents of `gc` rotated by one seat each time and seat 0 always the
+    first oya, so that every agent plays every seat on the same walls. Ranks and scores are given by agent
+    (0 for the `player` of the config, then the opponents) instead of by seat; "pt" is the mean over the rotations.
+    """
+    agents = list(gc.agents)
+    rotations = []
+    try:
+        for r in range(4):
+            gc.agents = agents[4 - r :] + agents[: 4 - r]  # agent a sits at seat (a + r) % 4
+            result = play_hanchan(gc, seed, oya=0)
+            scores = result["cumulative_scores"]
+            rotations.append(
+                {
+                    "ranks": [(seat - r) % 4 for seat in result["ranks"]],
+                    "pt": result["pt"],
+                    "cumulative_scores": [scores[(a + r) % 4] for a in range(4)],
+                }
+            )
+    finally:
+        gc.agents = agents
+    pt = np.zeros((4,), dtype=np.float64)
+    for rotation in rotations:
+        for idx, p in zip(rotation["ranks"], rotation["pt"]):
+            pt[idx] += p / len(rotations)
+    return {"pt": pt.round(2).tolist(), "rotations": rotations}
+
+
+def _play_hanchan_task(task) -> Dict[str, list]:
+    hanchan_idx, seed = task
+    result = play_hanchan(_worker_gc, seed)
+    result["hanchan"] = hanchan_idx
+    result["pid"] = os.getpid()
+    return result
+
+
+def _play_duplicate_task(task) -> Dict[str, list]:
+    # the four rotations of a seed run in one task, on one worker
+    seed_idx, seed = task
+    result = play_duplicate(_worker_gc, seed)
+    result["seed_idx"] = seed_idx
+    result["pid"] = os.getpid()
+    return result
+
+
+def run_tournament(
+    config: dict,
+    n_hanchans: int,
+    n_workers: int = 0,
+    seed: Optional[np.random.SeedSequence] = None,
+    duplicate: bool = False,
+    ordered: bool = False,
+) -> Iterator[Dict[str, list]]:
+    """
+    Play `n_hanchans` AI-only hanchans over a process pool and yield the results in order of completion, or
+    in order of the hanchan index if `ordered` (a result is then held back until the earlier ones are in).
+    With `duplicate`, play `n_hanchans` seeds of four seat rotations each instead, see `play_duplicate`.
+
+    Hanchans are handed out one at a time, so a worker finishing a short hanchan picks up the next one
+    immediately instead of waiting for a long one in the same batch.
+    Each hanchan gets its own child of `seed` (default: `config["seed"]`), so the results do not depend
+    on which worker played it.
+    """
+    config = dict(config)
+    config["verbose"] = False
+    if seed is None:
+        seed = config.get("seed")
+    tasks = list(enumerate(spawn_seeds(seed, n_hanchans)))
+    play_task = _play_duplicate_task if duplicate else _play_hanchan_task
+    if n_workers <= 0:
+        n_workers = os.cpu_count() or 1
+    n_workers = min(n_workers, n_hanchans)
+
+    if n_workers <= 1:
+        _init_worker(config)
+        try:
+            for task in tasks:
+                yield play_task(task)
+        finally:
+            _worker_gc.close()
+        return
+
+    if mp.get_start_method() == "fork":
+        # forked workers share the weight pages of the parent instead of each loading a copy
+        preload_agents(config)
+    pool = mp.Pool(n_workers, initializer=_init_worker, initargs=(config, True))
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        yield from imap(play_task, tasks, chunksize=1)
+        # let the workers exit normally so that their finalizers run
+        pool.close()
+        pool.join()
+    finally:
+        pool.terminate()
+
+
+def summarize(results) -> Dict[str, list]:
+    """
+    Average pt and rank distribution of each seat.
+    """
+    pts = np.zeros((4,), dtype=np.float64)
+    rank_counts = np.zeros((4, 4), dtype=np.int64)
+    for result in results:
+        for rank, (idx, pt) in enumerate(zip(result["ranks"], result["pt"])):
+            pts[idx] += pt
+            rank_counts[idx, rank] += 1
+    n = max(len(results), 1)
+    return {
+        "n_hanchans": len(results),
+        "mean_pt": (pts / n).round(2).tolist(),
+        "rank_counts": rank_counts.tolist(),
+    }
+
+
+def summarize_duplicate(results) -> Dict[str, list]:
+    """
+    Mean pt and rank distribution of each agent over duplicate results. The mean pt of an agent on one seed
+    is taken as one sample, so the standard errors only keep the variance left after the walls are shared.
+    """
+    pts = np.array([result["pt"] for result in results], dtype=np.float64).reshape(-1, 4)
+    rank_counts = np.zeros((4, 4), dtype=np.int64)
+    for result in results:
+        for rotation in result["rotations"]:
+            for rank, idx in enumerate(rotation["ranks"]):
+                rank_counts[idx, rank] += 1
+    n = len(results)
+    return {
+        "n_seeds": n,
+        "mean_pt": (pts.sum(axis=0) / max(n, 1)).round(2).tolist(),
+        "stderr_pt": (pts.std(axis=0, ddof=1) / np.sqrt(n)).round(2).tolist() if n > 1 else None,
+        "rank_counts": rank_counts.tolist(),
+    }
+
+
+def parse_args():
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser()
+    parser.add_argument(
+        "--config",
+        "-c",
+        type=str,
+        default="config/default.yaml",
+        help="base config for customized game control",
+    )
+    parser.add_argument(
+        "--n_hanchans", "-n", type=int, default=None, help="number of hanchans"
+    )
+    parser.add_argument(
+        "--n_workers", "-j", type=int, default=None, help="number of processes"
+    )
+    parser.add_argument(
+        "--seed", "-s", type=int, default=None, help="root seed of all hanchans"
+    )
+    parser.add_argument(
+        "--duplicate",
+        action="store_true",
+        help="play each seed four times with the agents rotated through the seats",
+    )
+    parser.add_argument(
+        "--output", "-o", type=str, default=None, help="jsonl file of the results"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+
+    tournament_config = config.get("tournament", {})
+    n_hanchans = args.n_hanchans or tournament_config.get("n_hanchans", 100)
+    n_workers = (
+        args.n_workers
+        if args.n_workers is not None
+        else tournament_config.get("n_workers", 0)
+    )
+    duplicate = args.duplicate or tournament_config.get("duplicate", False)
+
+    seed = np.random.SeedSequence(
+        args.seed if args.seed is not None else config.get("seed")
+    )
+    results = []
+    out = open(args.output, "w", encoding="utf-8") if args.output else None
+    for result in run_tournament(config, n_hanchans, n_workers, seed, duplicate):
+        results.append(result)
+        line = json.dumps(result)
+        print(line)
+        if out is not None:
+            out.write(line + "\n")
+            out.flush()
+    if out is not None:
+        out.close()
+    summary = summarize_duplicate(results) if duplicate else summarize(results)
+    summary["seed"] = seed.entropy  # rerun with -s to reproduce
+    print(json.dumps(summary))
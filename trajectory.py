@@ -0,0 +1,187 @@
+"""
+Self-play trajectories for offline RL.
+
+`TrajectoryWriter` is attached to a `MahjongGameCore` and stores one row per decision of any player:
+    obs (93, 34), oracle_obs (18, 34), valid action mask (47,), action, reward, done, player
+The observations are encoded straight into the shard buffer. The reward is 0 except for the last decision of
+each player in a round, which gets the round payoff (in points, honba and riichi sticks included) and done=True.
+Full shards of `shard_size` rows (about 3.8 KB per row) are handed to a background thread without copying and
+saved as `<prefix>_<index>.npz`; the default prefix holds the start time, the pid and a count of the writers of
+the process, so no two writers share one.
+
+`TrajectoryDataset` streams the shards back, split over the workers of a `torch.utils.data.DataLoader`.
+"""
+import os
+import time
+import glob
+import itertools
+import queue
+import threading
+from typing import Dict, List, Union
+
+import numpy as np
+from pymahjong import MahjongEnv
+
+FULL_OBS_DIM = MahjongEnv.PLAYER_OBS_DIM + MahjongEnv.ORACLE_OBS_DIM
+ROUND_SLACK = 1024  # rows a round may add beyond a full shard before it is settled
+MAX_QUEUED_SHARDS = 2  # the recording thread waits for the saver beyond that
+
+_writer_ids = itertools.count()  # of the writers of this process, e.g. one per table of a session host
+
+
+class TrajectoryWriter(object):
+    def __init__(self, directory: str, shard_size: int = 4096, prefix: Union[str, None] = None) -> None:
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_size = shard_size
+        if prefix is None:
+            prefix = f"traj_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{next(_writer_ids)}"
+        self.prefix = prefix
+        self.n_shards = 0
+
+        self._buf = self._alloc(shard_size + ROUND_SLACK)
+        self._n = 0  # rows in the buffer
+        self._round_start = 0
+        self._last_row = [-1] * 4  # last row of each player in the current round
+
+        self._queue = queue.Queue(maxsize=MAX_QUEUED_SHARDS)
+        self._thread = threading.Thread(target=self._save_loop, daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _alloc(n: int) -> Dict[str, np.ndarray]:
+        return {
+            "full_obs": np.zeros([n, FULL_OBS_DIM, MahjongEnv.MAHJONG_TILE_TYPES], dtype=bool),
+            "mask": np.zeros([n, MahjongEnv.ACTION_DIM], dtype=bool),
+            "action": np.zeros([n], dtype=np.int8),
+            "reward": np.zeros([n], dtype=np.float32),
+            "done": np.zeros([n], dtype=bool),
+            "player": np.zeros([n], dtype=np.int8),
+        }
+
+    def _grow(self):
+        new_buf = self._alloc(2 * len(self._buf["action"]))
+        for key, arr in self._buf.items():
+            new_buf[key][: self._n] = arr[: self._n]
+        self._buf = new_buf
+
+    def record(self, env: MahjongEnv, player_id: int, action: int):
+        """
+        Called before `env.step(player_id, action)`.
+        """
+        if self._n == len(self._buf["action"]):
+            self._grow()
+        row = self._n
+        env.get_full_obs(player_id, out=self._buf["full_obs"][row])
+        env.get_valid_actions(out=self._buf["mask"][row])
+        self._buf["action"][row] = action
+        self._buf["reward"][row] = 0
+        self._buf["done"][row] = False
+        self._buf["player"][row] = player_id
+        self._last_row[player_id] = row
+        self._n += 1
+
+    def end_round(self, payoffs: np.ndarray):
+        for player_id, row in enumerate(self._last_row):
+            if row >= 0:
+                self._buf["reward"][row] = payoffs[player_id]
+                self._buf["done"][row] = True
+        self._last_row = [-1] * 4
+
+        while self._n >= self.shard_size:
+            self._ship(self.shard_size)
+        self._round_start = self._n
+
+    def _ship(self, n: int):
+        # the saver takes the buffer itself, only the rows beyond the shard move to a fresh one
+        shard = {key: arr[:n] for key, arr in self._buf.items()}
+        rest = self._n - n
+        new_buf = self._alloc(max(self.shard_size + ROUND_SLACK, 2 * rest))
+        for key, arr in self._buf.items():
+            new_buf[key][:rest] = arr[n : self._n]
+        self._buf = new_buf
+        self._n = rest
+        path = os.path.join(self.directory, f"{self.prefix}_{self.n_shards:05d}.npz")
+        self.n_shards += 1
+        self._queue.put((path, shard))
+
+    def _save_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, shard = item
+            tmp_path = path[: -len(".npz")] + ".tmp.npz"
+            np.savez(tmp_path, **shard)
+            os.replace(tmp_path, path)  # readers never see a partial shard
+
+    def close(self):
+        """
+        Save the remaining finished rounds as a last (smaller) shard. An unfinished round is dropped.
+        """
+        self._n = self._round_start
+        if self._n > 0:
+            self._ship(self._n)
+        self._queue.put(None)
+        self._thread.join()
+
+
+def list_shards(directory: str) -> List[str]:
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(directory, "*.npz"))
+        if not path.endswith(".tmp.npz")
+    )
+
+
+def load_shard(path: str) -> Dict[str, np.ndarray]:
+    with np.load(path) as data:
+        full_obs = data["full_obs"]
+        return {
+            "obs": full_obs[:, : MahjongEnv.PLAYER_OBS_DIM],
+            "oracle_obs": full_obs[:, MahjongEnv.PLAYER_OBS_DIM :],
+            "valid_action_mask": data["mask"],
+            "action": data["action"].astype(np.int64),
+            "reward": data["reward"],
+            "done": data["done"],
+            "player": data["player"].astype(np.int64),
+        }
+
+
+try:
+    import torch
+    from torch.utils.data import IterableDataset, get_worker_info
+except ImportError:  # the writer does not need torch
+    torch = None
+
+if torch is not None:
+
+    class TrajectoryDataset(IterableDataset):
+        """
+        Samples of the shards in `directory`, each shard read by one DataLoader worker.
+        """
+
+        def __init__(self, directory: str, shuffle: bool = True, seed: int = 0) -> None:
+            super().__init__()
+            self.shards = list_shards(directory)
+            self.shuffle = shuffle
+            self.seed = seed
+            self.epoch = 0
+
+        def set_epoch(self, epoch: int):
+            self.epoch = epoch
+
+        def __iter__(self):
+            worker_info = get_worker_info()
+            worker_id, n_workers = (0, 1) if worker_info is None else (worker_info.id, worker_info.num_workers)
+            rng = np.random.default_rng((self.seed, self.epoch, worker_id))
+            shards = self.shards[worker_id::n_workers]
+            if self.shuffle:
+                shards = [shards[i] for i in rng.permutation(len(shards))]
+            for path in shards:
+                data = load_shard(path)
+                order = rng.permutation(len(data["action"])) if self.shuffle else range(len(data["action"]))
+                tensors = {key: torch.from_numpy(arr) for key, arr in data.items()}
+                for i in order:
+                    yield {key: t[i] for key, t in tensors.items()}
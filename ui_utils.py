@@ -1,4 +1,5 @@
-from typing import List
+import re
+from typing import Callable, Dict, Hashable, List, Tuple
 from utils import (
     JI_DECODE,
     WIND_TRANSLATION_TABLE,
@@ -18,6 +19,41 @@ RIVER_WIDTH = 12
 
 from MahjongPyWrapper import CounterResult
 
+# every tile notation (and "**" for a tile back) in one alternation, so a string is translated in a single pass
+TILE_PATTERN = re.compile(
+    "|".join(re.escape(z) for z in sorted(JI_DECODE, key=len, reverse=True))
+)
+
+
+def _tile_sub(match: re.Match) -> str:
+    return JI_DECODE[match.group()]
+
+
+def translate_tiles(tile_str: str) -> str:
+    return TILE_PATTERN.sub(_tile_sub, tile_str)
+
+
+class FragmentCache(object):
+    """
+    Last rendered fragment (hand, river, calls, dora...) of each owner, reused while its key is unchanged.
+    Keys only need to be unique within a round, so the cache must be cleared when a new round starts.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._fragments: Dict[Tuple[Hashable, str], Tuple[Hashable, str]] = {}
+
+    def clear(self):
+        self._fragments.clear()
+
+    def get(self, owner: Hashable, kind: str, key: Hashable, render: Callable[[], str]) -> str:
+        entry = self._fragments.get((owner, kind))
+        if entry is not None and entry[0] == key:
+            return entry[1]
+        text = render()
+        self._fragments[(owner, kind)] = (key, text)
+        return text
+
 
 def print_hand(player_hand_list: List[str], mask_hand: bool = False) -> str:
     pl_list = [tile_exp(tile) for tile in player_hand_list]
@@ -43,10 +79,7 @@ def print_callings(player_calling_infos: List[CallingInfo]) -> str:
     player_calling_strinfos = [str(item) for item in player_calling_infos]
     if len(player_calling_strinfos) > 2:
         player_calling_strinfos[2] = "\n  |" + player_calling_strinfos[2]
-    ret_str = "|".join(player_calling_strinfos)
-    for z, z_exp in JI_DECODE.items():
-        if z in ret_str:
-            ret_str = ret_str.replace(z, z_exp)
+    ret_str = translate_tiles("|".join(player_calling_strinfos))
 
     return f"[{ret_str}]"
 
@@ -1,7 +1,7 @@
 from enum import Enum
 import numpy as np
 from pymahjong import MahjongEnv
-from typing import Union
+from typing import List, Union
 
 JI_TILE = "東南西北白發中"
 # JI_DECODE = dict((f"{i+1}z", JI_TILE[i]) for i in range(len(JI_TILE)))
@@ -171,6 +171,21 @@ def is_forward_call(a: int) -> bool:
     return a >= MahjongEnv.CHILEFT and a <= MahjongEnv.PON or a == MahjongEnv.MINKAN
 
 
+def spawn_seeds(
+    seed: Union[int, np.random.SeedSequence, None], n: int
+) -> List[np.random.SeedSequence]:
+    """
+    Independent child seeds, e.g. one per hanchan or worker of a pool. `None` draws fresh entropy.
+    Unlike `SeedSequence.spawn`, the same parent always gives the same children.
+    """
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    return [
+        np.random.SeedSequence(seed.entropy, spawn_key=seed.spawn_key + (i,))
+        for i in range(n)
+    ]
+
+
 REMOVE_TILE_MARKS = {ord(i): None for i in "h-r"}
 
 